@@ -0,0 +1,333 @@
+"""Offline benchmarks for the agent loop.
+
+The model is replaced by a scripted backend that returns predetermined
+tool_use turns instantly, and the MCP servers are copies of the document
+server running in this process, so the numbers measure only the overhead of
+Chat, ToolManager and MCPClient.
+
+    python benchmark.py            # run and compare with the baseline
+    python benchmark.py --save     # run and store the results as baseline
+"""
+
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from types import SimpleNamespace
+from contextlib import (
+    AsyncExitStack,
+    asynccontextmanager,
+    redirect_stdout,
+)
+
+from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
+from anthropic.types import Message, TextBlock, ToolUseBlock, Usage
+
+import mcp_server
+from mcp_client import MCPClient
+from core.chat import Chat
+from core.claude import AsyncClaude
+from core.tools import ToolManager
+from core.history import HistoryCompactor
+from core.result_store import ResultStore
+
+BASELINE_PATH = Path("benchmarks/baseline.json")
+
+HISTORY_TURNS = [0, 25, 100]
+SERVER_COUNTS = [1, 4, 16]
+TOOL_COUNTS = [2, 20, 100]
+THROUGHPUT_SERVER_COUNTS = [1, 4, 8]
+PARALLEL_CALLS = 32
+TOOL_TURNS = 3
+
+
+def _dump(obj):
+    return obj.model_dump(exclude_none=True)
+
+
+class ScriptedStream:
+    def __init__(self, message: Message):
+        self._message = message
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for block in self._message.content:
+            if block.type == "text":
+                yield SimpleNamespace(type="text", text=block.text)
+            yield SimpleNamespace(
+                type="content_block_stop", content_block=block
+            )
+
+    async def get_final_message(self) -> Message:
+        return self._message
+
+
+class ScriptedMessages:
+    """Stands in for AsyncAnthropic.messages, returning the loaded turns
+    in order. Requests are JSON-encoded as the real client would, and the
+    time spent doing so is recorded."""
+
+    def __init__(self):
+        self._turns: list[Message] = []
+        self.requests = 0
+        self.serialize_seconds = 0.0
+
+    def load(self, turns: list[Message]):
+        self._turns = list(turns)
+
+    def _next(self, params: dict) -> Message:
+        start = time.perf_counter()
+        json.dumps(params, default=_dump)
+        self.serialize_seconds += time.perf_counter() - start
+        self.requests += 1
+        return self._turns.pop(0)
+
+    async def create(self, **params) -> Message:
+        return self._next(params)
+
+    def stream(self, **params) -> ScriptedStream:
+        return ScriptedStream(self._next(params))
+
+
+class ScriptedAnthropic:
+    def __init__(self):
+        self.messages = ScriptedMessages()
+
+    async def close(self):
+        pass
+
+
+def _message(content: list, stop_reason: str) -> Message:
+    return Message(
+        id="msg_bench",
+        type="message",
+        role="assistant",
+        model="scripted",
+        content=content,
+        stop_reason=stop_reason,
+        stop_sequence=None,
+        usage=Usage(input_tokens=0, output_tokens=0),
+    )
+
+
+def tool_turn(calls: list[tuple[str, dict]]) -> Message:
+    return _message(
+        [
+            ToolUseBlock(
+                id=f"toolu_{i}", type="tool_use", name=name, input=tool_input
+            )
+            for i, (name, tool_input) in enumerate(calls)
+        ],
+        "tool_use",
+    )
+
+
+def text_turn(text: str) -> Message:
+    return _message([TextBlock(type="text", text=text)], "end_turn")
+
+
+def tool_name(server: int, tool: int) -> str:
+    return f"read_doc_contents_{server}_{tool}"
+
+
+def build_server(index: int, tool_count: int) -> FastMCP:
+    """A copy of the document server exporting tool_count read tools."""
+    server = FastMCP(f"DocumentMCP-{index}", log_level="ERROR")
+    for tool in range(tool_count):
+        server.add_tool(
+            mcp_server.read_document,
+            name=tool_name(index, tool),
+            description="Read the contents of a document and return it as "
+            "a string.",
+            annotations=ToolAnnotations(readOnlyHint=True),
+        )
+    return server
+
+
+@asynccontextmanager
+async def agent(server_count: int, tools_per_server: int):
+    clients = {
+        f"server_{i}": MCPClient(
+            server=build_server(i, tools_per_server), name=f"server_{i}"
+        )
+        for i in range(server_count)
+    }
+    backend = ScriptedAnthropic()
+    claude_service = AsyncClaude(model="scripted", client=backend)
+
+    async with AsyncExitStack() as stack:
+        for client in clients.values():
+            stack.push_async_callback(client.cleanup)
+        await asyncio.gather(
+            *(client.connect() for client in clients.values())
+        )
+
+        tool_manager = ToolManager(clients, result_store=ResultStore())
+        await tool_manager.refresh()
+        chat = Chat(
+            claude_service,
+            clients,
+            tool_manager=tool_manager,
+            compactor=HistoryCompactor(),
+        )
+        yield chat, backend.messages
+
+
+def history(turns: int) -> list:
+    document = "The plan outlines the steps for the project. " * 100
+    messages = []
+    for i in range(turns):
+        messages.append(
+            {"role": "user", "content": f"Question {i}\n{document}"}
+        )
+        messages.append({"role": "assistant", "content": f"Answer {i}"})
+    return messages
+
+
+async def bench_dispatch(repeat: int) -> dict:
+    """Time per model turn of Chat.run, excluding the model itself."""
+    results = {}
+    script = [
+        *(
+            tool_turn([(tool_name(0, 0), {"doc_id": "plan.md"})])
+            for _ in range(TOOL_TURNS)
+        ),
+        text_turn("Done."),
+    ]
+    for mode in ["chat", "stream"]:
+        on_text = (lambda text: None) if mode == "stream" else None
+        for turns in HISTORY_TURNS:
+            async with agent(1, 2) as (chat, backend):
+                samples = []
+                for _ in range(repeat):
+                    chat.messages = history(turns)
+                    backend.load(script)
+                    start = time.perf_counter()
+                    # Chat.run prints the text of tool_use turns
+                    with redirect_stdout(io.StringIO()):
+                        await chat.run("Read plan.md", on_text=on_text)
+                    samples.append(
+                        (time.perf_counter() - start) / len(script)
+                    )
+                results[f"dispatch/{mode}/history={turns}"] = {
+                    "turn_ms": statistics.median(samples) * 1000,
+                    "serialize_ms": backend.serialize_seconds
+                    / backend.requests
+                    * 1000,
+                }
+    return results
+
+
+async def bench_routing(repeat: int) -> dict:
+    """Cost of listing tools and resolving a tool name to its server."""
+    results = {}
+    iterations = repeat * 10
+    for server_count in SERVER_COUNTS:
+        for tool_count in TOOL_COUNTS:
+            async with agent(server_count, tool_count) as (chat, _):
+                tool_manager = chat.tool_manager
+                last_tool = tool_name(server_count - 1, tool_count - 1)
+
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    await tool_manager.get_all_tools()
+                list_seconds = (time.perf_counter() - start) / iterations
+
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    await tool_manager._find_client_with_tool(last_tool)
+                find_seconds = (time.perf_counter() - start) / iterations
+
+            key = f"routing/servers={server_count}/tools={tool_count}"
+            results[key] = {
+                "list_tools_us": list_seconds * 1e6,
+                "find_tool_us": find_seconds * 1e6,
+            }
+    return results
+
+
+async def bench_throughput(repeat: int) -> dict:
+    """Tool calls per second for a turn requesting many tools at once."""
+    results = {}
+    for server_count in THROUGHPUT_SERVER_COUNTS:
+        message = tool_turn(
+            [
+                (tool_name(i % server_count, 0), {"doc_id": "plan.md"})
+                for i in range(PARALLEL_CALLS)
+            ]
+        )
+        async with agent(server_count, 2) as (chat, _):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                await chat.tool_manager.execute_tool_requests(message)
+            elapsed = time.perf_counter() - start
+
+        results[f"throughput/servers={server_count}"] = {
+            "calls_per_s": PARALLEL_CALLS * repeat / elapsed,
+        }
+    return results
+
+
+async def run(repeat: int) -> dict:
+    return {
+        **await bench_dispatch(repeat),
+        **await bench_routing(repeat),
+        **await bench_throughput(repeat),
+    }
+
+
+def report(results: dict, baseline: dict):
+    for key, metrics in results.items():
+        print(key)
+        for metric, value in metrics.items():
+            line = f"  {metric:<14} {value:>12.3f}"
+            previous = baseline.get(key, {}).get(metric)
+            if previous:
+                line += f"  baseline {previous:>12.3f}"
+                line += f"  ({(value - previous) / previous:+.1%})"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as baseline"
+    )
+    options = parser.parse_args()
+
+    try:
+        baseline = json.loads(options.baseline.read_text())["results"]
+    except (OSError, ValueError, KeyError):
+        baseline = {}
+
+    results = asyncio.run(run(options.repeat))
+    report(results, baseline)
+
+    if options.save:
+        options.baseline.parent.mkdir(parents=True, exist_ok=True)
+        options.baseline.write_text(
+            json.dumps(
+                {
+                    "python": sys.version.split()[0],
+                    "repeat": options.repeat,
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
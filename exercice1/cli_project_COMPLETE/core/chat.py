@@ -1,47 +1,151 @@
-from core.claude import Claude
+import asyncio
+import tracing
+from core.claude import Claude, AsyncClaude
 from mcp_client import MCPClient
 from core.tools import ToolManager
-from anthropic.types import MessageParam
+from core.history import HistoryCompactor
+from anthropic.types import Message, MessageParam, ToolResultBlockParam
+from typing import Callable, Optional
 
 
 class Chat:
-    def __init__(self, claude_service: Claude, clients: dict[str, MCPClient]):
+    def __init__(
+        self,
+        claude_service: Claude,
+        clients: dict[str, MCPClient],
+        tool_manager: Optional[ToolManager] = None,
+        compactor: Optional[HistoryCompactor] = None,
+    ):
         self.claude_service: Claude = claude_service
         self.clients: dict[str, MCPClient] = clients
+        self.tool_manager: ToolManager = tool_manager or ToolManager(clients)
+        self.compactor: Optional[HistoryCompactor] = compactor
         self.messages: list[MessageParam] = []
 
     async def _process_query(self, query: str):
         self.messages.append({"role": "user", "content": query})
 
+    async def _chat(self, **kwargs) -> Message:
+        """Requests a complete response without blocking the event loop."""
+        if isinstance(self.claude_service, AsyncClaude):
+            return await self.claude_service.chat(**kwargs)
+        return await asyncio.to_thread(self.claude_service.chat, **kwargs)
+
+    async def _stream_turn(
+        self, tools: list, on_text: Callable[[str], None]
+    ) -> tuple[Message, Optional[list[ToolResultBlockParam]]]:
+        """Streams one model turn, starting each read-only tool call as soon
+        as its tool_use block is complete."""
+        loop = asyncio.get_running_loop()
+        pending: dict[str, asyncio.Task] = {}
+        finished = False
+
+        def start_tool(block):
+            pending[block.id] = loop.create_task(
+                self.tool_manager.execute_tool_request(block)
+            )
+
+        def on_tool_use(block):
+            # Only tools without side effects run before the turn ends: if
+            # the stream fails or stops for another reason, they are
+            # cancelled and nothing has been changed on the servers
+            if not finished and self.tool_manager.is_read_only(block.name):
+                start_tool(block)
+
+        try:
+            if isinstance(self.claude_service, AsyncClaude):
+                response = await self.claude_service.stream(
+                    messages=self.messages,
+                    tools=tools,
+                    on_text=on_text,
+                    on_tool_use=on_tool_use,
+                )
+            else:
+                # The sync client blocks, so the stream is consumed in a
+                # worker thread and its callbacks are handed back to the
+                # event loop.
+                response = await asyncio.to_thread(
+                    self.claude_service.stream,
+                    messages=self.messages,
+                    tools=tools,
+                    on_text=lambda text: loop.call_soon_threadsafe(
+                        on_text, text
+                    ),
+                    on_tool_use=lambda block: loop.call_soon_threadsafe(
+                        on_tool_use, block
+                    ),
+                )
+
+            if response.stop_reason != "tool_use":
+                return response, None
+
+            tool_result_parts = []
+            for block in response.content:
+                if block.type == "tool_use" and block.id not in pending:
+                    start_tool(block)
+            for block in response.content:
+                if block.type == "tool_use":
+                    tool_result_parts.append(await pending[block.id])
+            return response, tool_result_parts
+        finally:
+            # Tool calls still running when the turn ends early, fails or
+            # is cancelled are not left behind
+            finished = True
+            for task in pending.values():
+                task.cancel()
+            await asyncio.gather(*pending.values(), return_exceptions=True)
+
     async def run(
         self,
         query: str,
+        on_text: Optional[Callable[[str], None]] = None,
     ) -> str:
-        final_text_response = ""
+        """Runs the agent loop for a query. When on_text is given, the
+        response is streamed and text deltas are passed to it."""
+        with tracing.span("chat.run", streaming=on_text is not None):
+            final_text_response = ""
 
-        await self._process_query(query)
+            await self._process_query(query)
 
-        while True:
-            response = self.claude_service.chat(
-                messages=self.messages,
-                tools=await ToolManager.get_all_tools(self.clients),
-            )
+            while True:
+                if self.compactor:
+                    self.messages = self.compactor.compact(self.messages)
 
-            self.claude_service.add_assistant_message(self.messages, response)
+                tools = await self.tool_manager.get_all_tools()
+                tool_result_parts = None
 
-            if response.stop_reason == "tool_use":
-                print(self.claude_service.text_from_message(response))
-                tool_result_parts = await ToolManager.execute_tool_requests(
-                    self.clients, response
-                )
+                if on_text:
+                    response, tool_result_parts = await self._stream_turn(
+                        tools, on_text
+                    )
+                else:
+                    response = await self._chat(
+                        messages=self.messages,
+                        tools=tools,
+                    )
 
-                self.claude_service.add_user_message(
-                    self.messages, tool_result_parts
+                self.claude_service.add_assistant_message(
+                    self.messages, response
                 )
-            else:
-                final_text_response = self.claude_service.text_from_message(
-                    response
-                )
-                break
+
+                if response.stop_reason == "tool_use":
+                    if tool_result_parts is None:
+                        print(
+                            self.claude_service.text_from_message(response)
+                        )
+                        tool_result_parts = (
+                            await self.tool_manager.execute_tool_requests(
+                                response
+                            )
+                        )
+
+                    self.claude_service.add_user_message(
+                        self.messages, tool_result_parts
+                    )
+                else:
+                    final_text_response = (
+                        self.claude_service.text_from_message(response)
+                    )
+                    break
 
         return final_text_response
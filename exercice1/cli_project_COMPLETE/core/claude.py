@@ -1,11 +1,66 @@
-from anthropic import Anthropic
-from anthropic.types import Message
+import time
+import httpx
+import asyncio
+import tracing
+from typing import Callable, Optional
+from anthropic import Anthropic, AsyncAnthropic, DefaultAsyncHttpxClient
+from anthropic.types import Message, ToolUseBlock
+from core.response_log import ResponseLog
+
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def _with_cache_control(message: dict) -> dict:
+    """Returns a copy of the message whose last content block carries a
+    cache breakpoint. The stored history is never modified."""
+    content = message["content"]
+    if isinstance(content, str):
+        if not content:
+            return message
+        content = [{"type": "text", "text": content}]
+    if not content:
+        return message
+
+    last = content[-1]
+    if hasattr(last, "model_dump"):
+        last = last.model_dump(exclude_none=True)
+    return {
+        **message,
+        "content": [*content[:-1], {**last, "cache_control": CACHE_CONTROL}],
+    }
+
+
+def _replay_events(
+    message: Message,
+    on_text: Optional[Callable[[str], None]],
+    on_tool_use: Optional[Callable[[ToolUseBlock], None]],
+):
+    for block in message.content:
+        if block.type == "text" and on_text:
+            on_text(block.text)
+        elif block.type == "tool_use" and on_tool_use:
+            on_tool_use(block)
 
 
 class Claude:
-    def __init__(self, model: str):
-        self.client = Anthropic()
+    def __init__(
+        self,
+        model: str,
+        prompt_caching: bool = True,
+        response_log: Optional[ResponseLog] = None,
+    ):
+        # Responses are recorded to, or served from, the log when given;
+        # replaying needs no API client
+        self.response_log = response_log
+        self.client = None if self._replaying else Anthropic()
         self.model = model
+        self.prompt_caching = prompt_caching
+        self.usage_history: list[dict] = []
+
+    @property
+    def _replaying(self) -> bool:
+        return self.response_log is not None and self.response_log.replaying
 
     def add_user_message(self, messages: list, message):
         user_message = {
@@ -30,7 +85,7 @@ class Claude:
             [block.text for block in message.content if block.type == "text"]
         )
 
-    def chat(
+    def _build_params(
         self,
         messages,
         system=None,
@@ -39,7 +94,7 @@ class Claude:
         tools=None,
         thinking=False,
         thinking_budget=1024,
-    ) -> Message:
+    ) -> dict:
         params = {
             "model": self.model,
             "max_tokens": 8000,
@@ -60,5 +115,274 @@ class Claude:
         if system:
             params["system"] = system
 
-        message = self.client.messages.create(**params)
-        return message
+        if self.prompt_caching:
+            self._add_cache_breakpoints(params)
+
+        return params
+
+    def _add_cache_breakpoints(self, params: dict):
+        """Marks the tools, the system prompt and the end of the history as
+        cacheable, using at most the four breakpoints the API allows."""
+        if params.get("tools"):
+            tools = list(params["tools"])
+            tools[-1] = {**tools[-1], "cache_control": CACHE_CONTROL}
+            params["tools"] = tools
+
+        if params.get("system"):
+            system = params["system"]
+            if isinstance(system, str):
+                system = [{"type": "text", "text": system}]
+            system = list(system)
+            system[-1] = {**system[-1], "cache_control": CACHE_CONTROL}
+            params["system"] = system
+
+        # The last user message caches the whole prefix for the next turn,
+        # and the one before it matches the prefix cached by the last turn.
+        messages = list(params["messages"])
+        user_indexes = [
+            i for i, message in enumerate(messages) if message["role"] == "user"
+        ]
+        for i in user_indexes[-2:]:
+            messages[i] = _with_cache_control(messages[i])
+        params["messages"] = messages
+
+    def _record_usage(self, message: Message):
+        usage = message.usage
+        tracing.annotate(
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            stop_reason=message.stop_reason,
+        )
+        self.usage_history.append(
+            {
+                "input_tokens": usage.input_tokens,
+                "output_tokens": usage.output_tokens,
+                "cache_read_input_tokens": usage.cache_read_input_tokens or 0,
+                "cache_creation_input_tokens": (
+                    usage.cache_creation_input_tokens or 0
+                ),
+            }
+        )
+
+    def cache_hit_rate(self) -> float:
+        """Share of prompt tokens served from the cache across all turns."""
+        read = sum(u["cache_read_input_tokens"] for u in self.usage_history)
+        total = read + sum(
+            u["input_tokens"] + u["cache_creation_input_tokens"]
+            for u in self.usage_history
+        )
+        return read / total if total else 0.0
+
+    def chat(
+        self,
+        messages,
+        system=None,
+        temperature=1.0,
+        stop_sequences=[],
+        tools=None,
+        thinking=False,
+        thinking_budget=1024,
+    ) -> Message:
+        params = self._build_params(
+            messages,
+            system=system,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            tools=tools,
+            thinking=thinking,
+            thinking_budget=thinking_budget,
+        )
+
+        with tracing.span("claude.chat", model=self.model):
+            if self._replaying:
+                message, delay = self.response_log.replay(params)
+                time.sleep(delay)
+            else:
+                start = time.perf_counter()
+                message = self.client.messages.create(**params)
+                if self.response_log:
+                    self.response_log.record(
+                        params, message, time.perf_counter() - start
+                    )
+            self._record_usage(message)
+            return message
+
+    def stream(
+        self,
+        messages,
+        system=None,
+        temperature=1.0,
+        stop_sequences=[],
+        tools=None,
+        thinking=False,
+        thinking_budget=1024,
+        on_text: Optional[Callable[[str], None]] = None,
+        on_tool_use: Optional[Callable[[ToolUseBlock], None]] = None,
+    ) -> Message:
+        """Streams a response, reporting text deltas and completed tool_use
+        blocks as they arrive, and returns the final message."""
+        params = self._build_params(
+            messages,
+            system=system,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            tools=tools,
+            thinking=thinking,
+            thinking_budget=thinking_budget,
+        )
+
+        with tracing.span("claude.stream", model=self.model):
+            if self._replaying:
+                message, delay = self.response_log.replay(params)
+                time.sleep(delay)
+                _replay_events(message, on_text, on_tool_use)
+                self._record_usage(message)
+                return message
+
+            start = time.perf_counter()
+            with self.client.messages.stream(**params) as stream:
+                for event in stream:
+                    if event.type == "text" and on_text:
+                        on_text(event.text)
+                    elif (
+                        event.type == "content_block_stop"
+                        and event.content_block.type == "tool_use"
+                        and on_tool_use
+                    ):
+                        on_tool_use(event.content_block)
+
+                message = stream.get_final_message()
+            if self.response_log:
+                self.response_log.record(
+                    params, message, time.perf_counter() - start
+                )
+            self._record_usage(message)
+            return message
+
+
+def create_async_client(
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+) -> AsyncAnthropic:
+    """Creates an AsyncAnthropic client with a tunable connection pool.
+
+    Pass the same client to several AsyncClaude services so that all
+    conversations in the process reuse its keep-alive connections."""
+    return AsyncAnthropic(
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            )
+        )
+    )
+
+
+class AsyncClaude(Claude):
+    def __init__(
+        self,
+        model: str,
+        client: Optional[AsyncAnthropic] = None,
+        prompt_caching: bool = True,
+        response_log: Optional[ResponseLog] = None,
+    ):
+        self.response_log = response_log
+        # A client passed in may be shared with other services, so it is
+        # left for its owner to close
+        self._owns_client = client is None and not self._replaying
+        self.client = (
+            None if self._replaying else client or create_async_client()
+        )
+        self.model = model
+        self.prompt_caching = prompt_caching
+        self.usage_history: list[dict] = []
+
+    async def chat(
+        self,
+        messages,
+        system=None,
+        temperature=1.0,
+        stop_sequences=[],
+        tools=None,
+        thinking=False,
+        thinking_budget=1024,
+    ) -> Message:
+        params = self._build_params(
+            messages,
+            system=system,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            tools=tools,
+            thinking=thinking,
+            thinking_budget=thinking_budget,
+        )
+
+        with tracing.span("claude.chat", model=self.model):
+            if self._replaying:
+                message, delay = self.response_log.replay(params)
+                await asyncio.sleep(delay)
+            else:
+                start = time.perf_counter()
+                message = await self.client.messages.create(**params)
+                if self.response_log:
+                    self.response_log.record(
+                        params, message, time.perf_counter() - start
+                    )
+            self._record_usage(message)
+            return message
+
+    async def stream(
+        self,
+        messages,
+        system=None,
+        temperature=1.0,
+        stop_sequences=[],
+        tools=None,
+        thinking=False,
+        thinking_budget=1024,
+        on_text: Optional[Callable[[str], None]] = None,
+        on_tool_use: Optional[Callable[[ToolUseBlock], None]] = None,
+    ) -> Message:
+        params = self._build_params(
+            messages,
+            system=system,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            tools=tools,
+            thinking=thinking,
+            thinking_budget=thinking_budget,
+        )
+
+        with tracing.span("claude.stream", model=self.model):
+            if self._replaying:
+                message, delay = self.response_log.replay(params)
+                await asyncio.sleep(delay)
+                _replay_events(message, on_text, on_tool_use)
+                self._record_usage(message)
+                return message
+
+            start = time.perf_counter()
+            async with self.client.messages.stream(**params) as stream:
+                async for event in stream:
+                    if event.type == "text" and on_text:
+                        on_text(event.text)
+                    elif (
+                        event.type == "content_block_stop"
+                        and event.content_block.type == "tool_use"
+                        and on_tool_use
+                    ):
+                        on_tool_use(event.content_block)
+
+                message = await stream.get_final_message()
+            if self.response_log:
+                self.response_log.record(
+                    params, message, time.perf_counter() - start
+                )
+            self._record_usage(message)
+            return message
+
+    async def close(self):
+        if self.client and self._owns_client:
+            await self.client.close()
@@ -8,6 +8,7 @@ from prompt_toolkit.auto_suggest import AutoSuggest, Suggestion
 from prompt_toolkit.document import Document
 from prompt_toolkit.buffer import Buffer
 
+import tracing
 from core.cli_chat import CliChat
 
 
@@ -111,8 +112,12 @@ class UnifiedCompleter(Completer):
 
 
 class CliApp:
-    def __init__(self, agent: CliChat):
+    def __init__(
+        self, agent: CliChat, stream: bool = False, show_usage: bool = False
+    ):
         self.agent = agent
+        self.stream = stream
+        self.show_usage = show_usage
         self.resources = []
         self.prompts = []
 
@@ -196,6 +201,26 @@ class CliApp:
         except Exception as e:
             print(f"Error refreshing prompts: {e}")
 
+    def print_usage(self, turns: list[dict]):
+        for usage in turns:
+            print(
+                f"[usage] input={usage['input_tokens']} "
+                f"cache_read={usage['cache_read_input_tokens']} "
+                f"cache_write={usage['cache_creation_input_tokens']} "
+                f"output={usage['output_tokens']}"
+            )
+        hit_rate = self.agent.claude_service.cache_hit_rate()
+        print(f"[usage] session cache hit rate: {hit_rate:.0%}")
+
+        result_store = self.agent.tool_manager.result_store
+        if result_store:
+            metrics = result_store.metrics()
+            print(
+                f"[usage] large tool results stored: "
+                f"{metrics['stored_results']}, "
+                f"bytes kept out of history: {metrics['bytes_saved']}"
+            )
+
     async def run(self):
         while True:
             try:
@@ -203,8 +228,24 @@ class CliApp:
                 if not user_input.strip():
                     continue
 
-                response = await self.agent.run(user_input)
-                print(f"\nResponse:\n{response}")
+                usage_history = self.agent.claude_service.usage_history
+                turns_before = len(usage_history)
+
+                with tracing.span("cli.query"):
+                    if self.stream:
+                        await self.agent.run(
+                            user_input,
+                            on_text=lambda text: print(
+                                text, end="", flush=True
+                            ),
+                        )
+                        print()
+                    else:
+                        response = await self.agent.run(user_input)
+                        print(f"\nResponse:\n{response}")
+
+                if self.show_usage:
+                    self.print_usage(usage_history[turns_before:])
 
             except KeyboardInterrupt:
                 break
@@ -1,9 +1,12 @@
-from typing import List, Tuple
+from typing import List, Optional
+from urllib.parse import urlencode
 from mcp.types import Prompt, PromptMessage
 from anthropic.types import MessageParam
 
 from core.chat import Chat
 from core.claude import Claude
+from core.tools import ToolManager
+from core.history import HistoryCompactor
 from mcp_client import MCPClient
 
 
@@ -13,20 +16,71 @@ class CliChat(Chat):
         doc_client: MCPClient,
         clients: dict[str, MCPClient],
         claude_service: Claude,
+        tool_manager: Optional[ToolManager] = None,
+        compactor: Optional[HistoryCompactor] = None,
     ):
-        super().__init__(clients=clients, claude_service=claude_service)
+        super().__init__(
+            clients=clients,
+            claude_service=claude_service,
+            tool_manager=tool_manager,
+            compactor=compactor,
+        )
 
         self.doc_client: MCPClient = doc_client
 
     async def list_prompts(self) -> list[Prompt]:
         return await self.doc_client.list_prompts()
 
-    async def list_docs_ids(self) -> list[str]:
-        return await self.doc_client.read_resource("docs://documents")
+    async def list_docs(
+        self,
+        prefix: str = "",
+        glob: str = "",
+        ids: Optional[list[str]] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> tuple[list[dict], Optional[str]]:
+        """A page of document metadata and the cursor of the next page,
+        None after the last one."""
+        if ids is not None and not ids:
+            return [], None
+        options = {
+            "limit": limit,
+            "prefix": prefix,
+            "glob": glob,
+            "ids": ",".join(ids) if ids is not None else "",
+            "cursor": cursor,
+        }
+        query = urlencode(
+            {key: value for key, value in options.items() if value}
+        )
+        page = await self.doc_client.read_resource(
+            f"docs://documents/page/{query}"
+        )
+        return page["documents"], page["next_cursor"]
+
+    async def list_docs_ids(
+        self, prefix: str = "", limit: int = 1000
+    ) -> list[str]:
+        """Ids of the first documents starting with prefix, at most limit
+        of them."""
+        doc_ids, cursor = [], None
+        while len(doc_ids) < limit:
+            docs, cursor = await self.list_docs(
+                prefix=prefix, cursor=cursor, limit=limit - len(doc_ids)
+            )
+            doc_ids += [doc["id"] for doc in docs]
+            if cursor is None:
+                break
+        return doc_ids
 
     async def get_doc_content(self, doc_id: str) -> str:
         return await self.doc_client.read_resource(f"docs://documents/{doc_id}")
 
+    async def get_docs_contents(self, doc_ids: list[str]) -> list[str]:
+        return await self.doc_client.read_resource_contents(
+            f"docs://documents/batch/{','.join(doc_ids)}"
+        )
+
     async def get_prompt(
         self, command: str, doc_id: str
     ) -> list[PromptMessage]:
@@ -35,17 +89,17 @@ class CliChat(Chat):
     async def _extract_resources(self, query: str) -> str:
         mentions = [word[1:] for word in query.split() if word.startswith("@")]
 
-        doc_ids = await self.list_docs_ids()
-        mentioned_docs: list[Tuple[str, str]] = []
+        if not mentions:
+            return ""
 
-        for doc_id in doc_ids:
-            if doc_id in mentions:
-                content = await self.get_doc_content(doc_id)
-                mentioned_docs.append((doc_id, content))
+        # Only list the mentioned documents to find those that exist
+        docs, _ = await self.list_docs(ids=mentions, limit=len(mentions))
+        doc_ids = [doc["id"] for doc in docs]
+        contents = await self.get_docs_contents(doc_ids) if doc_ids else []
 
         return "".join(
             f'\n<document id="{doc_id}">\n{content}\n</document>\n'
-            for doc_id, content in mentioned_docs
+            for doc_id, content in zip(doc_ids, contents)
         )
 
     async def _process_command(self, query: str) -> bool:
@@ -0,0 +1,204 @@
+import re
+import json
+from anthropic.types import MessageParam
+
+DOCUMENT_PATTERN = re.compile(
+    r'<document id="([^"]*)">.*?</document>', flags=re.DOTALL
+)
+QUERY_PATTERN = re.compile(r"<query>\s*(.*?)\s*</query>", flags=re.DOTALL)
+ELIDED_PREFIX = "[tool result elided"
+SUMMARY_PATTERN = re.compile(
+    r"<conversation_summary>\n(.*?)\n</conversation_summary>",
+    flags=re.DOTALL,
+)
+
+
+def _block_to_dict(block) -> dict:
+    if hasattr(block, "model_dump"):
+        return block.model_dump(exclude_none=True)
+    return block
+
+
+def _is_tool_result_message(message: MessageParam) -> bool:
+    content = message["content"]
+    return isinstance(content, list) and any(
+        _block_to_dict(block).get("type") == "tool_result" for block in content
+    )
+
+
+def _text_of(message: MessageParam) -> str:
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return "\n".join(
+        block["text"]
+        for block in map(_block_to_dict, content)
+        if block.get("type") == "text"
+    )
+
+
+class HistoryCompactor:
+    """Keeps Chat.messages under a token budget.
+
+    Stages run oldest-first and stop as soon as the history fits:
+    old tool_result payloads are elided, injected <document> blocks are
+    collapsed into references, then whole turns are folded into a summary.
+    The most recent turns are never touched, and turns are only dropped at
+    user query boundaries so tool_use/tool_result pairs stay intact.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 100_000,
+        keep_recent_turns: int = 2,
+        chars_per_token: int = 4,
+        summary_chars: int = 300,
+    ):
+        self.token_budget = token_budget
+        self.keep_recent_turns = max(keep_recent_turns, 1)
+        self.chars_per_token = chars_per_token
+        self.summary_chars = summary_chars
+
+    def estimate_tokens(self, messages: list[MessageParam]) -> int:
+        """Approximates the token count from the serialized size."""
+        size = 0
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                size += len(content)
+            else:
+                size += len(
+                    json.dumps([_block_to_dict(b) for b in content])
+                )
+        return size // self.chars_per_token
+
+    def _turn_starts(self, messages: list[MessageParam]) -> list[int]:
+        """Indexes of user messages that open a turn, i.e. queries rather
+        than tool results."""
+        return [
+            i
+            for i, message in enumerate(messages)
+            if message["role"] == "user"
+            and not _is_tool_result_message(message)
+        ]
+
+    def _elide_tool_results(self, message: MessageParam) -> MessageParam:
+        if not _is_tool_result_message(message):
+            return message
+        content = []
+        for block in map(_block_to_dict, message["content"]):
+            result = block.get("content", "")
+            # Blocks elided by an earlier compaction are left as they are,
+            # keeping the original size and the cached history prefix
+            if block.get("type") == "tool_result" and not (
+                isinstance(result, str) and result.startswith(ELIDED_PREFIX)
+            ):
+                size = len(json.dumps(result))
+                block = {
+                    **block,
+                    "content": f"{ELIDED_PREFIX}: {size} chars]",
+                }
+            content.append(block)
+        return {**message, "content": content}
+
+    def _collapse_documents(self, message: MessageParam) -> MessageParam:
+        if message["role"] != "user" or _is_tool_result_message(message):
+            return message
+
+        def collapse(text: str) -> str:
+            return DOCUMENT_PATTERN.sub(
+                r'<document id="\1" /> (content omitted, read the document '
+                r"again if needed)",
+                text,
+            )
+
+        content = message["content"]
+        if isinstance(content, str):
+            return {**message, "content": collapse(content)}
+        return {
+            **message,
+            "content": [
+                {**block, "text": collapse(block["text"])}
+                if block.get("type") == "text"
+                else block
+                for block in map(_block_to_dict, content)
+            ],
+        }
+
+    def summarize(self, turn: list[MessageParam]) -> str:
+        """Describes a dropped turn in a few lines. Override to plug in a
+        model-generated summary."""
+        lines = []
+        for message in turn:
+            if _is_tool_result_message(message):
+                continue
+
+            text = _text_of(message)
+            if message["role"] == "user":
+                previous = SUMMARY_PATTERN.search(text)
+                if previous:
+                    lines.append(previous.group(1))
+                    text = SUMMARY_PATTERN.sub("", text).strip()
+                query = QUERY_PATTERN.search(text)
+                text = query.group(1) if query else text
+                lines.append(f"- User: {text[: self.summary_chars]}")
+                continue
+
+            if not isinstance(message["content"], str):
+                tools = [
+                    block["name"]
+                    for block in map(_block_to_dict, message["content"])
+                    if block.get("type") == "tool_use"
+                ]
+                if tools:
+                    lines.append(f"- Assistant used: {', '.join(tools)}")
+            if text:
+                lines.append(f"- Assistant: {text[: self.summary_chars]}")
+        return "\n".join(lines)
+
+    def _fold_into_summary(
+        self, dropped: list[MessageParam], first_kept: MessageParam
+    ) -> MessageParam:
+        summary = (
+            f"<conversation_summary>\n{self.summarize(dropped)}\n"
+            "</conversation_summary>"
+        )
+        content = first_kept["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        return {
+            **first_kept,
+            "content": [{"type": "text", "text": summary}, *content],
+        }
+
+    def compact(self, messages: list[MessageParam]) -> list[MessageParam]:
+        """Returns a history that fits the token budget, or the original
+        list if it already does."""
+        if self.estimate_tokens(messages) <= self.token_budget:
+            return messages
+
+        starts = self._turn_starts(messages)
+        if len(starts) <= self.keep_recent_turns:
+            return messages
+        boundary = starts[-self.keep_recent_turns]
+        old, recent = messages[:boundary], messages[boundary:]
+
+        for stage in (self._elide_tool_results, self._collapse_documents):
+            old = [stage(message) for message in old]
+            if self.estimate_tokens(old + recent) <= self.token_budget:
+                return old + recent
+
+        # Fold whole turns, oldest first, into a summary carried by the
+        # first remaining turn.
+        compacted = old + recent
+        while True:
+            starts = self._turn_starts(compacted)
+            if len(starts) <= self.keep_recent_turns:
+                return compacted
+            cut = starts[1]
+            folded = self._fold_into_summary(
+                compacted[:cut], compacted[cut]
+            )
+            compacted = [folded, *compacted[cut + 1 :]]
+            if self.estimate_tokens(compacted) <= self.token_budget:
+                return compacted
@@ -0,0 +1,93 @@
+import json
+import hashlib
+from pathlib import Path
+from typing import Literal, Optional
+from collections import defaultdict, deque
+from anthropic.types import Message
+
+
+def _dump(obj):
+    return obj.model_dump(mode="json", exclude_none=True)
+
+
+def fingerprint(params: dict) -> str:
+    """Hashes everything sent to the model for a request."""
+    return hashlib.sha256(
+        json.dumps(
+            params, sort_keys=True, separators=(",", ":"), default=_dump
+        ).encode()
+    ).hexdigest()[:32]
+
+
+class ResponseLog:
+    """Model responses keyed by request fingerprint, one JSON line each.
+
+    In record mode every response is appended to the file. In replay mode
+    responses are served from it, in recorded order when the same request
+    was made several times, after latency seconds plus latency_scale times
+    the time the original response took."""
+
+    def __init__(
+        self,
+        path: Path,
+        mode: Literal["record", "replay"],
+        latency: float = 0.0,
+        latency_scale: float = 0.0,
+    ):
+        self.path = Path(path)
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self._responses: dict[str, deque[tuple[Message, float]]] = (
+            defaultdict(deque)
+        )
+        if mode == "replay":
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self):
+        with self.path.open() as f:
+            for line in f:
+                entry = json.loads(line)
+                self._responses[entry["key"]].append(
+                    (
+                        Message.model_validate(entry["message"]),
+                        entry["seconds"],
+                    )
+                )
+
+    def record(self, params: dict, message: Message, seconds: float):
+        entry = {
+            "key": fingerprint(params),
+            "seconds": round(seconds, 3),
+            "message": _dump(message),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def replay(self, params: dict) -> tuple[Message, float]:
+        """Returns the recorded response and how long to wait before
+        serving it."""
+        key = fingerprint(params)
+        responses = self._responses.get(key)
+        if not responses:
+            raise LookupError(
+                f"No recorded response for request {key} in {self.path}"
+            )
+        # Keep the last response for requests repeated more than recorded
+        message, seconds = (
+            responses.popleft() if len(responses) > 1 else responses[0]
+        )
+        return message, self.latency + self.latency_scale * seconds
+
+
+def open_response_log(
+    path: str, mode: str, latency: float = 0.0, latency_scale: float = 0.0
+) -> Optional[ResponseLog]:
+    if not path or mode not in ("record", "replay"):
+        return None
+    return ResponseLog(Path(path), mode, latency, latency_scale)
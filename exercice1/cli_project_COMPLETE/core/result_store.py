@@ -0,0 +1,119 @@
+import json
+import itertools
+from typing import Optional
+from collections import OrderedDict
+
+READ_RESULT_TOOL = "read_tool_result"
+
+
+class ResultStore:
+    """Keeps large tool outputs out of the conversation history.
+
+    Outputs above the threshold are stored under a handle and replaced with
+    a preview; the model pages through the full text with the
+    read_tool_result tool.
+    """
+
+    def __init__(
+        self,
+        threshold_bytes: int = 20_000,
+        preview_chars: int = 2_000,
+        page_chars: int = 10_000,
+        max_entries: int = 100,
+    ):
+        self.threshold_bytes = threshold_bytes
+        self.preview_chars = preview_chars
+        self.page_chars = page_chars
+        self.max_entries = max_entries
+        self._results: OrderedDict[str, str] = OrderedDict()
+        self._ids = itertools.count(1)
+        self.stored_count = 0
+        self.bytes_saved = 0
+
+    def tool_definition(self) -> dict:
+        return {
+            "name": READ_RESULT_TOOL,
+            "description": (
+                "Read a page of a large tool result that was truncated in "
+                "the conversation. Use the handle given in the truncated "
+                "result and increase offset to continue reading."
+            ),
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "handle": {
+                        "type": "string",
+                        "description": "Handle of the stored tool result",
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Character offset to start reading at",
+                        "default": 0,
+                        "minimum": 0,
+                    },
+                    "length": {
+                        "type": "integer",
+                        "description": "Number of characters to read",
+                        "default": self.page_chars,
+                        "minimum": 1,
+                    },
+                },
+                "required": ["handle"],
+            },
+        }
+
+    def maybe_store(self, texts: list[str]) -> str:
+        """Returns the JSON tool result content for the given texts, storing
+        them out of band if they exceed the threshold."""
+        content_json = json.dumps(texts)
+        full_size = len(content_json.encode())
+        if full_size <= self.threshold_bytes:
+            return content_json
+
+        text = "\n".join(texts)
+        handle = f"result-{next(self._ids)}"
+        self._results[handle] = text
+        if len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+        preview_json = json.dumps(
+            [
+                text[: self.preview_chars],
+                f"[Output truncated: showing {self.preview_chars} of "
+                f"{len(text)} characters. The full result is stored as "
+                f"handle '{handle}'; call {READ_RESULT_TOOL} with this "
+                "handle and an offset to read the rest.]",
+            ]
+        )
+        self.stored_count += 1
+        self.bytes_saved += full_size - len(preview_json.encode())
+        return preview_json
+
+    def read(
+        self, handle: str, offset: int = 0, length: Optional[int] = None
+    ) -> str:
+        """Returns one page of a stored result as JSON tool result content."""
+        if handle not in self._results:
+            raise ValueError(f"No stored tool result with handle {handle}")
+        if offset < 0:
+            raise ValueError(f"offset must not be negative, got {offset}")
+        if length is not None and length <= 0:
+            raise ValueError(f"length must be positive, got {length}")
+
+        self._results.move_to_end(handle)
+        text = self._results[handle]
+        end = offset + (length if length is not None else self.page_chars)
+        page = text[offset:end]
+        if end < len(text):
+            page += (
+                f"\n[{len(text) - end} more characters; continue with "
+                f"offset={end}]"
+            )
+        return json.dumps([page])
+
+    def metrics(self) -> dict:
+        return {
+            "stored_results": self.stored_count,
+            "retained_results": len(self._results),
+            "bytes_saved": self.bytes_saved,
+        }
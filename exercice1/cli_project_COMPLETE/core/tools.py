@@ -1,38 +1,137 @@
 import json
+import asyncio
+import tracing
 from typing import Optional, Literal, List
+from contextlib import AsyncExitStack
+from mcp import types
 from mcp.types import CallToolResult, Tool, TextContent
 from mcp_client import MCPClient
+from core.result_store import ResultStore, READ_RESULT_TOOL
 from anthropic.types import Message, ToolResultBlockParam
 
 
 class ToolManager:
-    @classmethod
-    async def get_all_tools(cls, clients: dict[str, MCPClient]) -> list[Tool]:
-        """Gets all tools from the provided clients."""
-        tools = []
-        for client in clients.values():
-            tool_models = await client.list_tools()
-            tools += [
-                {
-                    "name": t.name,
-                    "description": t.description,
-                    "input_schema": t.inputSchema,
-                }
-                for t in tool_models
-            ]
+    def __init__(
+        self,
+        clients: dict[str, MCPClient],
+        max_concurrency: Optional[int] = None,
+        max_concurrency_per_server: Optional[int] = None,
+        tool_timeout: Optional[float] = None,
+        result_store: Optional[ResultStore] = None,
+    ):
+        self.clients: dict[str, MCPClient] = clients
+        self.tool_timeout = tool_timeout
+        self.result_store = result_store
+        self._semaphore = (
+            asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        )
+        self._server_semaphores: dict[str, asyncio.Semaphore] = (
+            {
+                client_id: asyncio.Semaphore(max_concurrency_per_server)
+                for client_id in clients
+            }
+            if max_concurrency_per_server
+            else {}
+        )
+        # client id -> tools advertised by that client
+        self._tools: dict[str, list[Tool]] = {}
+        # tool name -> client id
+        self._index: dict[str, str] = {}
+        self._stale: set[str] = set(clients.keys())
+        self._refresh_lock = asyncio.Lock()
+
+        for client_id, client in clients.items():
+            client.add_notification_handler(
+                self._make_notification_handler(client_id)
+            )
+
+    def _make_notification_handler(self, client_id: str):
+        async def handler(notification):
+            if isinstance(notification, types.ToolListChangedNotification):
+                self._stale.add(client_id)
+
+        return handler
+
+    async def refresh(self):
+        """Re-lists tools of stale clients and rebuilds the name index."""
+        # Tool calls started while a response streams may refresh at the
+        # same time
+        async with self._refresh_lock:
+            # Clients are listed in their configured order, so that the tool
+            # list sent with each request keeps the same order
+            for client_id in [c for c in self.clients if c in self._stale]:
+                # Cleared before listing, so that a change notified while
+                # the list is in flight marks the client stale again
+                self._stale.discard(client_id)
+                client = self.clients[client_id]
+                try:
+                    self._tools[client_id] = await client.list_tools()
+                except BaseException:
+                    self._stale.add(client_id)
+                    raise
+            self._tools = {
+                client_id: self._tools[client_id]
+                for client_id in self.clients
+                if client_id in self._tools
+            }
+
+            index: dict[str, str] = {}
+            for client_id, tools in self._tools.items():
+                for tool in tools:
+                    if self.result_store and tool.name == READ_RESULT_TOOL:
+                        raise ValueError(
+                            f"Tool '{tool.name}' exported by '{client_id}' "
+                            "clashes with the built-in result reader"
+                        )
+                    if tool.name in index:
+                        raise ValueError(
+                            f"Tool '{tool.name}' is exported by both "
+                            f"'{index[tool.name]}' and '{client_id}'"
+                        )
+                    index[tool.name] = client_id
+            self._index = index
+
+    async def get_all_tools(self) -> list[Tool]:
+        """Gets all tools from the registry, refreshing stale clients first."""
+        if self._stale:
+            await self.refresh()
+
+        tools = [
+            {
+                "name": t.name,
+                "description": t.description,
+                "input_schema": t.inputSchema,
+            }
+            for tools in self._tools.values()
+            for t in tools
+        ]
+        if self.result_store:
+            tools.append(self.result_store.tool_definition())
         return tools
 
-    @classmethod
     async def _find_client_with_tool(
-        cls, clients: list[MCPClient], tool_name: str
-    ) -> Optional[MCPClient]:
-        """Finds the first client that has the specified tool."""
-        for client in clients:
-            tools = await client.list_tools()
-            tool = next((t for t in tools if t.name == tool_name), None)
-            if tool:
-                return client
-        return None
+        self, tool_name: str
+    ) -> Optional[str]:
+        """Looks up the id of the client that exports the specified tool."""
+        if self._stale:
+            await self.refresh()
+
+        return self._index.get(tool_name)
+
+    def is_read_only(self, tool_name: str) -> bool:
+        """Tells whether the tool is declared read-only by its server, from
+        the last listing."""
+        if self.result_store and tool_name == READ_RESULT_TOOL:
+            return True
+        client_id = self._index.get(tool_name)
+        if client_id is None:
+            return False
+        return any(
+            tool.name == tool_name
+            and tool.annotations is not None
+            and bool(tool.annotations.readOnlyHint)
+            for tool in self._tools[client_id]
+        )
 
     @classmethod
     def _build_tool_result_part(
@@ -49,59 +148,106 @@ class ToolManager:
             "is_error": status == "error",
         }
 
-    @classmethod
-    async def execute_tool_requests(
-        cls, clients: dict[str, MCPClient], message: Message
-    ) -> List[ToolResultBlockParam]:
-        """Executes a list of tool requests against the provided clients."""
-        tool_requests = [
-            block for block in message.content if block.type == "tool_use"
-        ]
-        tool_result_blocks: list[ToolResultBlockParam] = []
-        for tool_request in tool_requests:
-            tool_use_id = tool_request.id
-            tool_name = tool_request.name
-            tool_input = tool_request.input
-
-            client = await cls._find_client_with_tool(
-                list(clients.values()), tool_name
+    async def _call_tool(
+        self, client_id: str, tool_name: str, tool_input
+    ) -> CallToolResult | None:
+        """Calls a tool while holding the per-server and global limits."""
+        async with AsyncExitStack() as stack:
+            # The server's own slot is taken first, so that calls queued
+            # behind a busy server do not hold global slots that calls to
+            # idle servers could use
+            if client_id in self._server_semaphores:
+                await stack.enter_async_context(
+                    self._server_semaphores[client_id]
+                )
+            if self._semaphore:
+                await stack.enter_async_context(self._semaphore)
+            return await asyncio.wait_for(
+                self.clients[client_id].call_tool(tool_name, tool_input),
+                timeout=self.tool_timeout,
             )
 
-            if not client:
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id, "Could not find that tool", "error"
-                )
-                tool_result_blocks.append(tool_result_part)
-                continue
+    async def execute_tool_request(
+        self, tool_request
+    ) -> ToolResultBlockParam:
+        """Executes a single tool_use block and builds its result part."""
+        with tracing.span("tools.call", tool=tool_request.name):
+            return await self._execute_tool_request(tool_request)
 
+    async def _execute_tool_request(
+        self, tool_request
+    ) -> ToolResultBlockParam:
+        tool_use_id = tool_request.id
+        tool_name = tool_request.name
+        tool_input = tool_request.input
+
+        if self.result_store and tool_name == READ_RESULT_TOOL:
             try:
-                tool_output: CallToolResult | None = await client.call_tool(
-                    tool_name, tool_input
-                )
-                items = []
-                if tool_output:
-                    items = tool_output.content
-                content_list = [
-                    item.text for item in items if isinstance(item, TextContent)
-                ]
-                content_json = json.dumps(content_list)
-                tool_result_part = cls._build_tool_result_part(
+                return self._build_tool_result_part(
                     tool_use_id,
-                    content_json,
-                    "error"
-                    if tool_output and tool_output.isError
-                    else "success",
+                    self.result_store.read(**tool_input),
+                    "success",
                 )
-            except Exception as e:
-                error_message = f"Error executing tool '{tool_name}': {e}"
-                print(error_message)
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id,
-                    json.dumps({"error": error_message}),
-                    "error"
-                    if tool_output and tool_output.isError
-                    else "success",
+            except (ValueError, TypeError) as e:
+                return self._build_tool_result_part(
+                    tool_use_id, json.dumps({"error": str(e)}), "error"
                 )
 
-            tool_result_blocks.append(tool_result_part)
-        return tool_result_blocks
+        client_id = await self._find_client_with_tool(tool_name)
+
+        if not client_id:
+            return self._build_tool_result_part(
+                tool_use_id, "Could not find that tool", "error"
+            )
+
+        try:
+            tool_output = await self._call_tool(
+                client_id, tool_name, tool_input
+            )
+            items = []
+            if tool_output:
+                items = tool_output.content
+            content_list = [
+                item.text for item in items if isinstance(item, TextContent)
+            ]
+            content_json = (
+                self.result_store.maybe_store(content_list)
+                if self.result_store
+                else json.dumps(content_list)
+            )
+            return self._build_tool_result_part(
+                tool_use_id,
+                content_json,
+                "error" if tool_output and tool_output.isError else "success",
+            )
+        except asyncio.TimeoutError:
+            error_message = (
+                f"Tool '{tool_name}' timed out after {self.tool_timeout}s"
+            )
+        except Exception as e:
+            error_message = f"Error executing tool '{tool_name}': {e}"
+
+        print(error_message)
+        return self._build_tool_result_part(
+            tool_use_id, json.dumps({"error": error_message}), "error"
+        )
+
+    async def execute_tool_requests(
+        self, message: Message
+    ) -> List[ToolResultBlockParam]:
+        """Executes the message's tool requests concurrently, in order."""
+        tool_requests = [
+            block for block in message.content if block.type == "tool_use"
+        ]
+        with tracing.span("tools.execute", count=len(tool_requests)):
+            if self._stale:
+                await self.refresh()
+
+            return list(
+                await asyncio.gather(
+                    *(
+                        self.execute_tool_request(tool_request)
+                        for tool_request in tool_requests
+                    )
+                )
+            )
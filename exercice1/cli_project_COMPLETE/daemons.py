@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import asyncio
+import hashlib
+import subprocess
+from pathlib import Path
+from typing import Optional
+import anyio
+import uvicorn
+from mcp.server.fastmcp import FastMCP
+
+REGISTRY_PATH = Path(
+    os.getenv("MCP_DAEMON_REGISTRY", ".mcp_cache/daemons.json")
+)
+HOST = "127.0.0.1"
+
+
+def _script_digest(args: list[str]) -> str:
+    """Hashes the server script, if one is found in the arguments."""
+    script = next((Path(arg) for arg in args if arg.endswith(".py")), None)
+    if script is None or not script.is_file():
+        return ""
+    return hashlib.sha256(script.read_bytes()).hexdigest()
+
+
+def daemon_key(
+    command: str, args: list[str], env: Optional[dict] = None
+) -> str:
+    """Hashes everything that decides what a daemon serves: the command,
+    the working directory scripts are found from, the environment it is
+    given and the script itself, so that a change to any of them starts
+    a new daemon instead of reusing a stale one."""
+    return hashlib.sha256(
+        json.dumps(
+            [command, args, os.getcwd(), sorted((env or {}).items())]
+        ).encode()
+        + _script_digest(args).encode()
+    ).hexdigest()
+
+
+def load_registry() -> dict:
+    try:
+        return json.loads(REGISTRY_PATH.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_registry(registry: dict):
+    REGISTRY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = REGISTRY_PATH.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(registry, indent=2))
+    os.replace(tmp_path, REGISTRY_PATH)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+async def _port_open(port: int) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(HOST, port), timeout=0.2
+        )
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    await writer.wait_closed()
+    return True
+
+
+def _read_port(port_file: Path) -> Optional[int]:
+    try:
+        return int(port_file.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+async def is_alive(entry: dict) -> bool:
+    return _pid_alive(entry["pid"]) and await _port_open(entry["port"])
+
+
+def _spawn(
+    command: str, args: list[str], env: Optional[dict], port_file: Path
+) -> subprocess.Popen:
+    daemon_env = {
+        **os.environ,
+        **(env or {}),
+        "MCP_TRANSPORT": "streamable-http",
+        "MCP_PORT_FILE": str(port_file),
+    }
+    if sys.platform == "win32":
+        detach = {"creationflags": subprocess.DETACHED_PROCESS}
+    else:
+        detach = {"start_new_session": True}
+    return subprocess.Popen(
+        [command, *args],
+        env=daemon_env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        **detach,
+    )
+
+
+async def ensure_daemon(
+    command: str,
+    args: list[str],
+    env: Optional[dict] = None,
+    startup_timeout: float = 30.0,
+) -> str:
+    """Returns the URL of a running daemon for this server, starting one
+    and recording it in the registry if none is alive.
+
+    The server script must honour MCP_TRANSPORT and MCP_PORT_FILE by
+    calling serve(), as mcp_server.py does."""
+    key = daemon_key(command, args, env)
+    script = _script_digest(args)
+    entry = load_registry().get(key)
+    if entry and await is_alive(entry):
+        return entry["url"]
+
+    # The daemon binds a port picked by the OS and writes it to this file,
+    # so no other process can take the port between choosing and binding
+    port_file = REGISTRY_PATH.parent / f"{key[:16]}.port"
+    port_file.parent.mkdir(parents=True, exist_ok=True)
+    port_file.unlink(missing_ok=True)
+    process = _spawn(command, args, env, port_file)
+    deadline = time.monotonic() + startup_timeout
+    port = None
+    while port is None or not await _port_open(port):
+        port = port or _read_port(port_file)
+        if process.poll() is not None:
+            raise ConnectionError(
+                f"Daemon for {command} {' '.join(args)} exited with code "
+                f"{process.returncode}"
+            )
+        if time.monotonic() > deadline:
+            process.terminate()
+            raise TimeoutError(
+                f"Daemon for {command} {' '.join(args)} did not start "
+                f"within {startup_timeout}s"
+            )
+        await asyncio.sleep(0.05)
+    port_file.unlink(missing_ok=True)
+
+    url = f"http://{HOST}:{port}/mcp"
+    registry = load_registry()
+    # Daemons still running an older version of the script are never
+    # used again
+    for old_key, old in list(registry.items()):
+        if (
+            [old["command"], old["args"], old["cwd"]]
+            == [command, args, os.getcwd()]
+            and old.get("script") != script
+        ):
+            _terminate(old["pid"])
+            del registry[old_key]
+    registry[key] = {
+        "command": command,
+        "args": args,
+        "cwd": os.getcwd(),
+        "env": env or {},
+        "script": script,
+        "pid": process.pid,
+        "port": port,
+        "url": url,
+    }
+    save_registry(registry)
+    return url
+
+
+def serve(server: FastMCP):
+    """Runs server over streamable HTTP on a free port and writes the port
+    to MCP_PORT_FILE once it is bound, for ensure_daemon to read."""
+    sock = socket.socket()
+    sock.bind((HOST, 0))
+    port_file = Path(os.environ["MCP_PORT_FILE"])
+    tmp_path = port_file.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(str(sock.getsockname()[1]))
+    os.replace(tmp_path, port_file)
+
+    config = uvicorn.Config(
+        server.streamable_http_app(),
+        log_level=server.settings.log_level.lower(),
+    )
+    anyio.run(uvicorn.Server(config).serve, [sock])
+
+
+def _terminate(pid: int):
+    if _pid_alive(pid):
+        os.kill(pid, signal.SIGTERM)
+
+
+def stop_daemons():
+    registry = load_registry()
+    for entry in registry.values():
+        _terminate(entry["pid"])
+    save_registry({})
+
+
+def main():
+    if sys.argv[1:] == ["stop"]:
+        stop_daemons()
+        return
+
+    for entry in load_registry().values():
+        status = "running" if asyncio.run(is_alive(entry)) else "dead"
+        print(
+            f"{entry['pid']:>7}  {status:<7}  {entry['url']}  "
+            f"{entry['command']} {' '.join(entry['args'])}"
+        )
+
+
+if __name__ == "__main__":
+    main()
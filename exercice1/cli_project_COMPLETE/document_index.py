@@ -0,0 +1,86 @@
+import re
+import bisect
+from typing import Optional
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+
+
+class DocumentIndex:
+    """Offsets of the lines and Markdown sections of a document.
+
+    Built once per version of a document, so that a line, byte or section
+    range is turned into character offsets without scanning the text
+    again. Offsets are in characters unless stated otherwise."""
+
+    def __init__(self, text: str):
+        self.length = len(text)
+        # Character and UTF-8 byte offset of the start of each line
+        self.line_starts: list[int] = []
+        self.line_bytes: list[int] = []
+        chars = size = 0
+        for line in text.split("\n"):
+            self.line_starts.append(chars)
+            self.line_bytes.append(size)
+            chars += len(line) + 1
+            size += len(line.encode()) + 1
+        self.size = size - 1
+        # A final newline ends the last line rather than starting another
+        if len(self.line_starts) > 1 and self.line_starts[-1] == self.length:
+            self.line_starts.pop()
+            self.line_bytes.pop()
+
+        # (level, title, start, end), each section running until the next
+        # heading of the same or a higher level
+        self.sections: list[tuple[int, str, int, int]] = []
+        headings = [
+            (len(m.group(1)), m.group(2), m.start())
+            for m in HEADING_PATTERN.finditer(text)
+        ]
+        for i, (level, title, start) in enumerate(headings):
+            end = next(
+                (s for lv, _, s in headings[i + 1 :] if lv <= level),
+                self.length,
+            )
+            self.sections.append((level, title, start, end))
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_starts)
+
+    def line_at(self, offset: int) -> int:
+        """The line, numbered from 1, holding the character at offset."""
+        return bisect.bisect_right(self.line_starts, offset)
+
+    def line_at_byte(self, offset: int) -> int:
+        return bisect.bisect_right(self.line_bytes, offset)
+
+    def lines(self, first: int, last: Optional[int] = None) -> tuple[int, int]:
+        """The span of lines first to last, numbered from 1 and inclusive,
+        or to the end of the document when last is None."""
+        first = min(max(first, 1), self.line_count + 1)
+        start = (
+            self.line_starts[first - 1]
+            if first <= self.line_count
+            else self.length
+        )
+        if last is None or last >= self.line_count:
+            return start, self.length
+        return start, max(self.line_starts[last], start)
+
+    def section(self, title: str) -> Optional[tuple[int, int]]:
+        """The span of the first section with this heading, ignoring case."""
+        title = title.strip().lstrip("#").strip().lower()
+        for _, heading, start, end in self.sections:
+            if heading.lower() == title:
+                return start, end
+        return None
+
+    def chunk_end(self, start: int, end: int, max_chars: int) -> int:
+        """Where a chunk of at most max_chars from start should stop: at the
+        start of a line when one falls inside it, so that lines are not
+        split across chunks."""
+        limit = start + max_chars
+        if limit >= end:
+            return end
+        cut = self.line_starts[self.line_at(limit) - 1]
+        return cut if cut > start else limit
@@ -0,0 +1,449 @@
+import time
+import bisect
+import sqlite3
+from abc import ABC, abstractmethod
+from fnmatch import fnmatchcase
+from pathlib import Path
+from collections import OrderedDict
+from typing import Iterator, Optional
+from piece_table import PieceTable
+from document_index import DocumentIndex
+from search_index import InvertedIndex, SNIPPET_TOKENS, snippet, tokenize
+
+
+SCHEMA_VERSION = 2
+# Line and section indexes kept for the most recently read documents
+INDEX_CACHE_SIZE = 64
+
+
+class DocumentStore(ABC):
+    """Storage backend of the document server, mapping ids to text."""
+
+    def __init__(self):
+        # doc id -> (version, index)
+        self._indexes: OrderedDict[str, tuple[int, DocumentIndex]] = (
+            OrderedDict()
+        )
+
+    @abstractmethod
+    def get(self, doc_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def version(self, doc_id: str) -> Optional[int]:
+        """Starts at 1 and goes up with every change to the document."""
+
+    def read(self, doc_id: str, start: int, end: int) -> str:
+        """The characters from start to end of the document."""
+        content = self.get(doc_id)
+        if content is None:
+            raise KeyError(doc_id)
+        return content[start:end]
+
+    def index(self, doc_id: str) -> Optional[DocumentIndex]:
+        """The line and section index of the current version of the
+        document, built on first use."""
+        version = self.version(doc_id)
+        if version is None:
+            return None
+        cached = self._indexes.get(doc_id)
+        if cached and cached[0] == version:
+            self._indexes.move_to_end(doc_id)
+            return cached[1]
+        index = DocumentIndex(self.get(doc_id))
+        self._indexes[doc_id] = (version, index)
+        self._indexes.move_to_end(doc_id)
+        if len(self._indexes) > INDEX_CACHE_SIZE:
+            self._indexes.popitem(last=False)
+        return index
+
+    @abstractmethod
+    def put(self, doc_id: str, content: str):
+        ...
+
+    @abstractmethod
+    def ids(self) -> Iterator[str]:
+        ...
+
+    @abstractmethod
+    def listing(
+        self,
+        prefix: str = "",
+        glob: str = "",
+        ids: Optional[list[str]] = None,
+        after: str = "",
+        limit: int = 100,
+    ) -> list[dict]:
+        """Up to limit {"id", "size", "modified", "version"} entries in id
+        order, for the ids after the given one that start with prefix,
+        match the glob pattern and, when given, are one of ids."""
+
+    def edit(
+        self, doc_id: str, replacements: list[tuple[str, str]]
+    ) -> list[int]:
+        """Applies the (old, new) replacements in order, each to every
+        occurrence, and returns how many occurrences each one replaced.
+        Either all replacements are stored or, on error, none are."""
+        _check_replacements(replacements)
+        content = self.get(doc_id)
+        if content is None:
+            raise KeyError(doc_id)
+        table = PieceTable(content)
+        counts = [table.replace_all(old, new) for old, new in replacements]
+        if any(counts):
+            self.put(doc_id, str(table))
+        return counts
+
+    @abstractmethod
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """Ranks documents against the query with BM25 and returns up to
+        limit {"id", "score", "snippet"} entries, best first."""
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.get(doc_id) is not None
+
+    def close(self):
+        pass
+
+
+def _check_replacements(replacements: list[tuple[str, str]]):
+    for old, _ in replacements:
+        if not old:
+            raise ValueError("The text to replace cannot be empty")
+
+
+class MemoryDocumentStore(DocumentStore):
+    """Keeps every document in a dict of piece tables; edits are lost on
+    restart.
+
+    Edited documents are re-indexed on the next search rather than on
+    every edit, so a run of edits re-indexes each document once."""
+
+    def __init__(self, docs: Optional[dict[str, str]] = None):
+        super().__init__()
+        self._docs: dict[str, PieceTable] = {
+            doc_id: PieceTable(content)
+            for doc_id, content in (docs or {}).items()
+        }
+        now = time.time()
+        # doc id -> (modified, version, size in bytes), kept up to date on
+        # writes so that listings do not join and encode the text
+        self._stats: dict[str, tuple[float, int, int]] = {
+            doc_id: (now, 1, len(content.encode()))
+            for doc_id, content in (docs or {}).items()
+        }
+        # Ids in order for listings, rebuilt after a document is added
+        self._sorted_ids: Optional[list[str]] = None
+        self._index = InvertedIndex()
+        self._unindexed: set[str] = set()
+        for doc_id, content in (docs or {}).items():
+            self._index.add(doc_id, content)
+
+    def _touch(self, doc_id: str, size: int):
+        if doc_id not in self._stats:
+            self._sorted_ids = None
+        _, version, _ = self._stats.get(doc_id, (0.0, 0, 0))
+        self._stats[doc_id] = (time.time(), version + 1, size)
+        self._unindexed.add(doc_id)
+
+    def get(self, doc_id: str) -> Optional[str]:
+        table = self._docs.get(doc_id)
+        return str(table) if table is not None else None
+
+    def version(self, doc_id: str) -> Optional[int]:
+        entry = self._stats.get(doc_id)
+        return entry[1] if entry else None
+
+    def read(self, doc_id: str, start: int, end: int) -> str:
+        if doc_id not in self._docs:
+            raise KeyError(doc_id)
+        return str(self._docs[doc_id])[start:end]
+
+    def put(self, doc_id: str, content: str):
+        self._docs[doc_id] = PieceTable(content)
+        self._touch(doc_id, len(content.encode()))
+
+    def edit(
+        self, doc_id: str, replacements: list[tuple[str, str]]
+    ) -> list[int]:
+        _check_replacements(replacements)
+        if doc_id not in self._docs:
+            raise KeyError(doc_id)
+        # Edit a copy so that the document is only swapped in once every
+        # replacement has been applied
+        table = self._docs[doc_id].copy()
+        counts = [table.replace_all(old, new) for old, new in replacements]
+        if any(counts):
+            # Every occurrence of old became new, so the size changes by
+            # the difference in their lengths for each one
+            size = self._stats[doc_id][2] + sum(
+                count * (len(new.encode()) - len(old.encode()))
+                for count, (old, new) in zip(counts, replacements)
+            )
+            self._docs[doc_id] = table
+            self._touch(doc_id, size)
+        return counts
+
+    def ids(self) -> Iterator[str]:
+        return iter(list(self._docs))
+
+    def listing(
+        self,
+        prefix: str = "",
+        glob: str = "",
+        ids: Optional[list[str]] = None,
+        after: str = "",
+        limit: int = 100,
+    ) -> list[dict]:
+        if ids is not None:
+            candidates = sorted(set(ids) & self._docs.keys())
+        else:
+            if self._sorted_ids is None:
+                self._sorted_ids = sorted(self._docs)
+            candidates = self._sorted_ids
+
+        entries = []
+        if prefix > after:
+            start = bisect.bisect_left(candidates, prefix)
+        else:
+            start = bisect.bisect_right(candidates, after)
+        for doc_id in candidates[start:]:
+            if len(entries) >= limit or not doc_id.startswith(prefix):
+                break
+            if glob and not fnmatchcase(doc_id, glob):
+                continue
+            modified, version, size = self._stats[doc_id]
+            entries.append(
+                {
+                    "id": doc_id,
+                    "size": size,
+                    "modified": modified,
+                    "version": version,
+                }
+            )
+        return entries
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        for doc_id in self._unindexed:
+            self._index.add(doc_id, str(self._docs[doc_id]))
+        self._unindexed.clear()
+
+        terms = set(tokenize(query))
+        return [
+            {
+                "id": doc_id,
+                "score": round(score, 4),
+                "snippet": snippet(str(self._docs[doc_id]), terms),
+            }
+            for doc_id, score in self._index.search(query, limit)
+        ]
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+
+class SqliteDocumentStore(DocumentStore):
+    """Keeps documents in an SQLite database and reads them by id on
+    demand, so opening the store does not depend on the corpus size.
+
+    Each write is its own transaction with a synchronous commit, so an
+    edit is either fully on disk or not at all after a crash. The seed
+    documents are only inserted when the database is created."""
+
+    def __init__(self, path: Path, seed: Optional[dict[str, str]] = None):
+        super().__init__()
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        with self._db:
+            self._db.execute("BEGIN")
+            (version,) = self._db.execute("PRAGMA user_version").fetchone()
+            if version < 1:
+                self._create_documents(seed or {})
+            if version < 2:
+                self._create_search_index()
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _create_documents(self, seed: dict[str, str]):
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                modified REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1
+            )
+            """
+        )
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR IGNORE INTO documents "
+            "(id, content, size, modified) VALUES (?, ?, ?, ?)",
+            [
+                (doc_id, content, len(content.encode()), now)
+                for doc_id, content in seed.items()
+            ],
+        )
+
+    def _create_search_index(self):
+        # An FTS5 index over the content column, kept in step with the
+        # documents table by triggers. executescript() would commit the
+        # open transaction, so statements are run one by one.
+        for statement in [
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                content, content='documents', content_rowid='rowid'
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS documents_ai
+            AFTER INSERT ON documents BEGIN
+                INSERT INTO documents_fts (rowid, content)
+                VALUES (new.rowid, new.content);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS documents_ad
+            AFTER DELETE ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, content)
+                VALUES ('delete', old.rowid, old.content);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS documents_au
+            AFTER UPDATE OF content ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, content)
+                VALUES ('delete', old.rowid, old.content);
+                INSERT INTO documents_fts (rowid, content)
+                VALUES (new.rowid, new.content);
+            END
+            """,
+            "INSERT INTO documents_fts (documents_fts) VALUES ('rebuild')",
+        ]:
+            self._db.execute(statement)
+
+    def get(self, doc_id: str) -> Optional[str]:
+        row = self._db.execute(
+            "SELECT content FROM documents WHERE id = ?", (doc_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def version(self, doc_id: str) -> Optional[int]:
+        row = self._db.execute(
+            "SELECT version FROM documents WHERE id = ?", (doc_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def read(self, doc_id: str, start: int, end: int) -> str:
+        # substr() counts characters from 1; only the range reaches Python
+        row = self._db.execute(
+            "SELECT substr(content, ?, ?) FROM documents WHERE id = ?",
+            (start + 1, max(end - start, 0), doc_id),
+        ).fetchone()
+        if row is None:
+            raise KeyError(doc_id)
+        return row[0]
+
+    def put(self, doc_id: str, content: str):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                """
+                INSERT INTO documents (id, content, size, modified)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    content = excluded.content,
+                    size = excluded.size,
+                    modified = excluded.modified,
+                    version = version + 1
+                """,
+                (doc_id, content, len(content.encode()), time.time()),
+            )
+
+    def ids(self) -> Iterator[str]:
+        for (doc_id,) in self._db.execute(
+            "SELECT id FROM documents ORDER BY id"
+        ):
+            yield doc_id
+
+    def listing(
+        self,
+        prefix: str = "",
+        glob: str = "",
+        ids: Optional[list[str]] = None,
+        after: str = "",
+        limit: int = 100,
+    ) -> list[dict]:
+        # Keyset pagination on the primary key, so a page costs the same
+        # however deep into the listing it is. A prefix narrows the range
+        # of the index that is scanned.
+        clauses, params = ["id > ?"], [after]
+        if prefix:
+            clauses += ["id >= ?", "substr(id, 1, ?) = ?"]
+            params += [prefix, len(prefix), prefix]
+            if prefix[-1] < chr(0x10FFFF):
+                clauses.append("id < ?")
+                params.append(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        if glob:
+            clauses.append("id GLOB ?")
+            params.append(glob)
+        if ids is not None:
+            clauses.append(f"id IN ({', '.join('?' * len(ids))})")
+            params += ids
+        rows = self._db.execute(
+            f"""
+            SELECT id, size, modified, version FROM documents
+            WHERE {' AND '.join(clauses)}
+            ORDER BY id
+            LIMIT ?
+            """,
+            (*params, limit),
+        )
+        return [
+            {"id": doc_id, "size": size, "modified": modified, "version": v}
+            for doc_id, size, modified, v in rows
+        ]
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        rows = self._db.execute(
+            f"""
+            SELECT documents.id, -documents_fts.rank,
+                snippet(documents_fts, 0, '', '', '…', {SNIPPET_TOKENS})
+            FROM documents_fts
+            JOIN documents ON documents.rowid = documents_fts.rowid
+            WHERE documents_fts MATCH ?
+            ORDER BY documents_fts.rank
+            LIMIT ?
+            """,
+            (" OR ".join(f'"{term}"' for term in terms), limit),
+        )
+        return [
+            {"id": doc_id, "score": round(score, 4), "snippet": text}
+            for doc_id, score, text in rows
+        ]
+
+    def __contains__(self, doc_id: str) -> bool:
+        return (
+            self._db.execute(
+                "SELECT 1 FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+            is not None
+        )
+
+    def close(self):
+        self._db.close()
+
+
+def open_document_store(
+    path: str, seed: Optional[dict[str, str]] = None
+) -> DocumentStore:
+    """An SQLite store at path, or an in-memory store without one."""
+    if path:
+        return SqliteDocumentStore(Path(path), seed)
+    return MemoryDocumentStore(seed)
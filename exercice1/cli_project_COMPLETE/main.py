@@ -1,11 +1,21 @@
 import asyncio
 import sys
 import os
+import time
 from dotenv import load_dotenv
 from contextlib import AsyncExitStack
+from typing import Optional
 
 from mcp_client import MCPClient
-from core.claude import Claude
+from core.claude import AsyncClaude, create_async_client
+from core.tools import ToolManager
+from core.history import HistoryCompactor
+from core.result_store import ResultStore
+from core.response_log import open_response_log
+from metrics import MetricsRegistry
+import tracing
+from resource_cache import ResourceCache
+from pathlib import Path
 
 from core.cli_chat import CliChat
 from core.cli import CliApp
@@ -16,18 +26,156 @@ load_dotenv()
 claude_model = os.getenv("CLAUDE_MODEL", "")
 anthropic_api_key = os.getenv("ANTHROPIC_API_KEY", "")
 
+# Cache the tools, system prompt and history prefix between turns
+prompt_caching = os.getenv("PROMPT_CACHING", "1") == "1"
+# Print token usage, including cache reads and writes, after each query
+show_usage = os.getenv("SHOW_USAGE", "0") == "1"
+
+# Anthropic HTTP connection pool, shared by every conversation
+anthropic_max_connections = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "100"))
+anthropic_max_keepalive = int(os.getenv("ANTHROPIC_MAX_KEEPALIVE", "20"))
+anthropic_keepalive_expiry = float(
+    os.getenv("ANTHROPIC_KEEPALIVE_EXPIRY", "30")
+)
+
+# Tool execution limits (0 disables the limit)
+max_tool_concurrency = int(os.getenv("MAX_TOOL_CONCURRENCY", "0"))
+max_tool_concurrency_per_server = int(
+    os.getenv("MAX_TOOL_CONCURRENCY_PER_SERVER", "0")
+)
+tool_timeout = float(os.getenv("TOOL_TIMEOUT", "0"))
+# Tool outputs larger than this many bytes are kept out of the history
+# (0 keeps every output inline)
+tool_result_threshold = int(os.getenv("TOOL_RESULT_THRESHOLD", "20000"))
+
+# Approximate token budget for the conversation history (0 disables
+# compaction)
+history_token_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "100000"))
+
+# Seconds each MCP server gets to start and complete its handshake
+server_startup_timeout = float(os.getenv("SERVER_STARTUP_TIMEOUT", "30"))
+show_startup_times = os.getenv("SHOW_STARTUP_TIMES", "0") == "1"
+# Advertise tools from a cached manifest and spawn each server only when
+# it is first used
+lazy_servers = os.getenv("LAZY_SERVERS", "0") == "1"
+# Server processes per additional MCP server; tool calls go to the least
+# busy one. The document server keeps a single process since it holds state.
+server_pool_size = int(os.getenv("SERVER_POOL_SIZE", "1"))
+# Seconds between health-check pings; dead servers are restarted in the
+# background (0 disables health checks)
+health_check_interval = float(os.getenv("HEALTH_CHECK_INTERVAL", "15"))
+# Record MCP request latency and payload sizes, dumped as JSON to this file
+# every METRICS_DUMP_INTERVAL seconds and on exit (unset disables metrics)
+metrics_path = os.getenv("METRICS_PATH", "")
+metrics_dump_interval = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+# Resources read from the document server are cached (0 disables the
+# cache). Entries are invalidated by resource subscriptions when the server
+# supports them and otherwise expire after RESOURCE_CACHE_TTL seconds.
+resource_cache_size = int(os.getenv("RESOURCE_CACHE_SIZE", "256"))
+resource_cache_ttl = float(os.getenv("RESOURCE_CACHE_TTL", "30"))
+# Append trace spans of each query, including the spans of the servers it
+# calls, to this file in the OTLP JSON format (unset disables tracing)
+trace_path = os.getenv("TRACE_PATH", "")
+# SQLite database the document server keeps its documents in, so edits
+# survive restarts (unset keeps them in memory)
+document_db = os.getenv("DOCUMENT_DB", "")
+# Reuse long-lived server daemons across CLI sessions
+daemon_servers = os.getenv("DAEMON_SERVERS", "0") == "1"
+# Run the document server inside this process over in-memory streams
+in_process_servers = os.getenv("IN_PROCESS_SERVERS", "0") == "1"
+
+# Print the response as it is generated instead of after the agent loop
+stream_responses = os.getenv("STREAM_RESPONSES", "1") == "1"
+
+# Record model responses to RESPONSE_LOG_PATH, or replay them from it
+# without calling the API (RESPONSE_LOG_MODE=record or replay). Replayed
+# responses are delayed by REPLAY_LATENCY seconds plus REPLAY_LATENCY_SCALE
+# times the time they originally took.
+response_log = open_response_log(
+    os.getenv("RESPONSE_LOG_PATH", ""),
+    os.getenv("RESPONSE_LOG_MODE", ""),
+    latency=float(os.getenv("REPLAY_LATENCY", "0")),
+    latency_scale=float(os.getenv("REPLAY_LATENCY_SCALE", "0")),
+)
+replaying = response_log is not None and response_log.replaying
+
 
 assert claude_model, "Error: CLAUDE_MODEL cannot be empty. Update .env"
-assert anthropic_api_key, (
+assert anthropic_api_key or replaying, (
     "Error: ANTHROPIC_API_KEY cannot be empty. Update .env"
 )
 
 
+async def start_client(
+    client_id: str, client: MCPClient, timeout: float
+) -> tuple[str, float, Optional[Exception]]:
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(client.start(), timeout=timeout)
+        error = None
+    except asyncio.TimeoutError:
+        error = TimeoutError(f"did not start within {timeout}s")
+    except Exception as e:
+        error = e
+    return client_id, time.perf_counter() - start, error
+
+
+async def start_clients(
+    clients: dict[str, MCPClient], timeout: float
+) -> dict[str, MCPClient]:
+    """Connects all clients concurrently and returns the ones that started.
+
+    A server that fails or times out is reported and left out; it does not
+    delay the others."""
+    results = await asyncio.gather(
+        *(
+            start_client(client_id, client, timeout)
+            for client_id, client in clients.items()
+        )
+    )
+
+    started = {}
+    for client_id, elapsed, error in results:
+        if error:
+            print(f"Failed to start {client_id} ({elapsed:.2f}s): {error}")
+            continue
+        if show_startup_times:
+            if clients[client_id].connected:
+                print(f"Started {client_id} in {elapsed:.2f}s")
+            else:
+                print(f"Deferred {client_id} (cached manifest)")
+        started[client_id] = clients[client_id]
+    return started
+
+
 async def main():
-    claude_service = Claude(model=claude_model)
+    anthropic_client = (
+        None
+        if replaying
+        else create_async_client(
+            max_connections=anthropic_max_connections,
+            max_keepalive_connections=anthropic_max_keepalive,
+            keepalive_expiry=anthropic_keepalive_expiry,
+        )
+    )
+    claude_service = AsyncClaude(
+        model=claude_model,
+        client=anthropic_client,
+        prompt_caching=prompt_caching,
+        response_log=response_log,
+    )
 
     server_scripts = sys.argv[1:]
     clients = {}
+    metrics = MetricsRegistry() if metrics_path else None
+    tracing.configure(trace_path, "cli")
+    # Spawned servers only inherit a minimal environment
+    server_env = {}
+    if trace_path:
+        # Servers that honour MCP_TRACE_PATH add their spans to the same file
+        server_env["MCP_TRACE_PATH"] = str(Path(trace_path).resolve())
+    if document_db:
+        server_env["DOCUMENT_DB"] = str(Path(document_db).resolve())
 
     command, args = (
         ("uv", ["run", "mcp_server.py"])
@@ -35,26 +183,83 @@ async def main():
         else ("python", ["mcp_server.py"])
     )
 
-    async with AsyncExitStack() as stack:
-        doc_client = await stack.enter_async_context(
-            MCPClient(command=command, args=args)
+    doc_server = None
+    if in_process_servers:
+        from mcp_server import mcp as doc_server
+
+    clients["doc_client"] = MCPClient(
+        command=command,
+        args=args,
+        env=server_env or None,
+        server=doc_server,
+        lazy=lazy_servers,
+        daemon=daemon_servers,
+        health_check_interval=health_check_interval or None,
+        name="doc_client",
+        metrics=metrics,
+        resource_cache=ResourceCache(
+            max_entries=resource_cache_size, ttl=resource_cache_ttl or None
+        )
+        if resource_cache_size
+        else None,
+    )
+    for i, server_script in enumerate(server_scripts):
+        client_id = f"client_{i}_{server_script}"
+        clients[client_id] = MCPClient(
+            command="uv",
+            args=["run", server_script],
+            env=server_env or None,
+            lazy=lazy_servers,
+            daemon=daemon_servers,
+            pool_size=server_pool_size,
+            health_check_interval=health_check_interval or None,
+            name=client_id,
+            metrics=metrics,
         )
-        clients["doc_client"] = doc_client
 
-        for i, server_script in enumerate(server_scripts):
-            client_id = f"client_{i}_{server_script}"
-            client = await stack.enter_async_context(
-                MCPClient(command="uv", args=["run", server_script])
+    async with AsyncExitStack() as stack:
+        if anthropic_client:
+            stack.push_async_callback(anthropic_client.close)
+        stack.push_async_callback(claude_service.close)
+        if metrics:
+            metrics.start_periodic_dump(
+                Path(metrics_path), metrics_dump_interval
             )
-            clients[client_id] = client
+            stack.push_async_callback(
+                metrics.stop_periodic_dump, Path(metrics_path)
+            )
+
+        for client in clients.values():
+            stack.push_async_callback(client.cleanup)
+        clients = await start_clients(clients, server_startup_timeout)
+
+        if "doc_client" not in clients:
+            raise ConnectionError("The document server could not be started")
+        doc_client = clients["doc_client"]
+
+        tool_manager = ToolManager(
+            clients,
+            max_concurrency=max_tool_concurrency or None,
+            max_concurrency_per_server=max_tool_concurrency_per_server
+            or None,
+            tool_timeout=tool_timeout or None,
+            result_store=ResultStore(threshold_bytes=tool_result_threshold)
+            if tool_result_threshold
+            else None,
+        )
 
         chat = CliChat(
             doc_client=doc_client,
             clients=clients,
             claude_service=claude_service,
+            tool_manager=tool_manager,
+            compactor=HistoryCompactor(token_budget=history_token_budget)
+            if history_token_budget
+            else None,
         )
+        await tool_manager.refresh()
 
-        cli = CliApp(chat)
+        cli = CliApp(chat, stream=stream_responses, show_usage=show_usage)
         await cli.initialize()
         await cli.run()
 
@@ -0,0 +1,52 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+MANIFEST_DIR = Path(os.getenv("MCP_MANIFEST_DIR", ".mcp_cache"))
+
+
+def _find_lockfile(script: Path) -> Optional[Path]:
+    for directory in [script.parent, *script.parent.parents]:
+        lockfile = directory / "uv.lock"
+        if lockfile.is_file():
+            return lockfile
+    return None
+
+
+def manifest_key(command: str, args: list[str]) -> Optional[str]:
+    """Hashes the server command, its script and the nearest uv.lock.
+
+    Returns None when no script can be found in the arguments, since the
+    server's tools could then change without the key changing."""
+    script = next(
+        (Path(arg) for arg in args if arg.endswith(".py")), None
+    )
+    if script is None or not script.is_file():
+        return None
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([command, args]).encode())
+    digest.update(script.read_bytes())
+    lockfile = _find_lockfile(script.resolve())
+    if lockfile:
+        digest.update(lockfile.read_bytes())
+    return digest.hexdigest()
+
+
+def load_manifest(key: str) -> Optional[dict]:
+    path = MANIFEST_DIR / f"{key}.json"
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(key: str, manifest: dict):
+    MANIFEST_DIR.mkdir(parents=True, exist_ok=True)
+    path = MANIFEST_DIR / f"{key}.json"
+    # Write then rename so a concurrent reader never sees a partial file
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(manifest))
+    os.replace(tmp_path, path)
@@ -1,41 +1,488 @@
 import sys
+import time
+import anyio
+import httpx
 import asyncio
-from typing import Optional, Any
-from contextlib import AsyncExitStack
+import binascii
+from typing import Optional, Any, AsyncIterator, Awaitable, Callable
+from contextlib import AsyncExitStack, asynccontextmanager
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.server.fastmcp import FastMCP
+from mcp.shared.memory import create_client_server_memory_streams
+from mcp.shared.exceptions import McpError
+from daemons import ensure_daemon
+from manifest import manifest_key, load_manifest, save_manifest
+from metrics import MetricsRegistry
+from resource_cache import ResourceCache
 
 import json
+import tracing
 from pydantic import AnyUrl
 
+TRANSPORT_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    httpx.TransportError,
+    ConnectionError,
+)
+
+
+def _is_transport_error(error: BaseException) -> bool:
+    if isinstance(error, McpError):
+        return error.error.code == types.CONNECTION_CLOSED
+    return isinstance(error, TRANSPORT_ERRORS)
+
+
+def _parse_resource(resource) -> Any:
+    if isinstance(resource, types.TextResourceContents):
+        if resource.mimeType == "application/json":
+            return json.loads(resource.text)
+
+        return resource.text
+    if isinstance(resource, types.BlobResourceContents):
+        # a2b_base64 reads the str directly, without encoding it first
+        return binascii.a2b_base64(resource.blob)
+    return None
+
+
+def _trace_meta() -> Optional[dict]:
+    # Lets the server parent its spans to the current client span
+    traceparent = tracing.current_traceparent()
+    return {"traceparent": traceparent} if traceparent else None
+
+
+def _iter_chunks(resource, chunk_size: int):
+    if isinstance(resource, types.TextResourceContents):
+        for start in range(0, len(resource.text), chunk_size):
+            yield resource.text[start : start + chunk_size]
+    elif isinstance(resource, types.BlobResourceContents):
+        # Decode whole base64 quanta so each chunk stands on its own
+        step = max(chunk_size // 3, 1) * 4
+        for start in range(0, len(resource.blob), step):
+            yield binascii.a2b_base64(resource.blob[start : start + step])
+
 
 class MCPClient:
     def __init__(
         self,
-        command: str,
-        args: list[str],
+        command: str = "",
+        args: Optional[list[str]] = None,
         env: Optional[dict] = None,
+        lazy: bool = False,
+        daemon: bool = False,
+        url: Optional[str] = None,
+        server: Optional[FastMCP] = None,
+        pool_size: int = 1,
+        health_check_interval: Optional[float] = None,
+        max_reconnect_attempts: int = 5,
+        max_reconnect_backoff: float = 30.0,
+        max_retries: int = 1,
+        name: Optional[str] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        resource_cache: Optional[ResourceCache] = None,
     ):
+        args = args or []
         self._command = command
         self._args = args
         self._env = env
-        self._session: Optional[ClientSession] = None
-        self._exit_stack: AsyncExitStack = AsyncExitStack()
+        # With daemon=True the server runs as a long-lived local process
+        # shared across CLI sessions and is reached over streamable HTTP;
+        # url attaches to an already running server instead.
+        self._daemon = daemon
+        self._url = url
+        # A FastMCP server given directly runs in this event loop and is
+        # reached over in-memory streams, without a process or encoding.
+        self._server = server
+        # With lazy=True and a cached manifest, start() does not spawn the
+        # server; it is connected on the first request the manifest cannot
+        # answer.
+        self._manifest_key: Optional[str] = (
+            manifest_key(command, args) if lazy else None
+        )
+        self._manifest: Optional[dict] = (
+            load_manifest(self._manifest_key) if self._manifest_key else None
+        )
+        self._connect_lock: asyncio.Lock = asyncio.Lock()
+        self._daemon_lock: asyncio.Lock = asyncio.Lock()
+        # pool_size > 1 opens several sessions (one server process each over
+        # stdio) and spreads calls across them. Listings and notifications
+        # come from the first session, so the pool looks like one server.
+        # A daemon, URL or in-process server is shared by every session,
+        # so there the pool adds sessions but not processes.
+        self._pool_size = max(pool_size, 1)
+        self._sessions: list[Optional[ClientSession]] = [
+            None
+        ] * self._pool_size
+        self._outstanding: list[int] = [0] * self._pool_size
+        self._runners: list[Optional[asyncio.Task]] = []
+        self._closing: asyncio.Event = asyncio.Event()
+        # Sessions are pinged every health_check_interval seconds. A dead
+        # session is reopened in the background with exponential backoff,
+        # and idempotent requests that hit a transport error are retried.
+        self._health_check_interval = health_check_interval
+        self._max_reconnect_attempts = max_reconnect_attempts
+        self._max_reconnect_backoff = max_reconnect_backoff
+        self._max_retries = max_retries
+        self._health_task: Optional[asyncio.Task] = None
+        self._reconnect_tasks: dict[int, asyncio.Task] = {}
+        self._idempotent_tools: set[str] = set()
+        self.stats = {
+            "reconnects": 0,
+            "failed_reconnects": 0,
+            "retries": 0,
+            "last_reconnect_seconds": None,
+        }
+        self._notification_handlers: list[
+            Callable[[Any], Awaitable[None]]
+        ] = []
+        # Requests are only measured when a registry is given
+        self.name = name or (
+            server.name if server else " ".join([command, *args])
+        )
+        self._metrics = metrics
+        # Parsed read_resource results, kept fresh through resource
+        # subscriptions when the server supports them
+        self._resource_cache = resource_cache
+        self._subscribed: set[str] = set()
+        self._read_only_tools: set[str] = set()
 
-    async def connect(self):
-        server_params = StdioServerParameters(
-            command=self._command,
-            args=self._args,
-            env=self._env,
+    def add_notification_handler(
+        self, handler: Callable[[Any], Awaitable[None]]
+    ):
+        """Registers a coroutine called with every server notification."""
+        self._notification_handlers.append(handler)
+
+    async def _handle_message(self, message):
+        if not isinstance(message, types.ServerNotification):
+            return
+        if self._resource_cache:
+            match message.root:
+                case types.ResourceUpdatedNotification(params=params):
+                    self._resource_cache.invalidate(str(params.uri))
+                case types.ResourceListChangedNotification():
+                    self._resource_cache.clear()
+        for handler in self._notification_handlers:
+            await handler(message.root)
+
+    async def _open_memory_streams(self, stack: AsyncExitStack):
+        client_streams, server_streams = await stack.enter_async_context(
+            create_client_server_memory_streams()
         )
-        stdio_transport = await self._exit_stack.enter_async_context(
-            stdio_client(server_params)
+        server = self._server._mcp_server
+        task_group = await stack.enter_async_context(
+            anyio.create_task_group()
         )
-        _stdio, _write = stdio_transport
-        self._session = await self._exit_stack.enter_async_context(
-            ClientSession(_stdio, _write)
+        task_group.start_soon(
+            lambda: server.run(
+                *server_streams, server.create_initialization_options()
+            )
         )
-        await self._session.initialize()
+        # Stop the server once the session above it has been closed
+        stack.callback(task_group.cancel_scope.cancel)
+        return client_streams
+
+    async def _server_url(self) -> Optional[str]:
+        if self._url is not None or self._server is not None:
+            return self._url
+        if not self._daemon:
+            return None
+        # Pooled slots connect at the same time: the first one starts the
+        # daemon and the others find it in the registry
+        async with self._daemon_lock:
+            return await ensure_daemon(self._command, self._args, self._env)
+
+    async def _open_session(
+        self, stack: AsyncExitStack, slot: int
+    ) -> ClientSession:
+        url = await self._server_url()
+
+        if self._server is not None:
+            _stdio, _write = await self._open_memory_streams(stack)
+        elif url is not None:
+            _stdio, _write, _ = await stack.enter_async_context(
+                streamablehttp_client(url)
+            )
+        else:
+            server_params = StdioServerParameters(
+                command=self._command,
+                args=self._args,
+                env=self._env,
+            )
+            _stdio, _write = await stack.enter_async_context(
+                stdio_client(server_params)
+            )
+        # Every slot is connected to the same server, so notifications
+        # are only taken from the first one
+        session = await stack.enter_async_context(
+            ClientSession(
+                _stdio,
+                _write,
+                message_handler=self._handle_message if slot == 0 else None,
+            )
+        )
+        await session.initialize()
+        return session
+
+    @property
+    def _session(self) -> Optional[ClientSession]:
+        return self._sessions[0]
+
+    async def _run(self, ready: asyncio.Future, slot: int):
+        # The transport and session are entered and exited in this task, so
+        # connect() and cleanup() may be awaited from any task.
+        try:
+            async with AsyncExitStack() as stack:
+                self._sessions[slot] = await self._open_session(stack, slot)
+                ready.set_result(None)
+                await self._closing.wait()
+        except Exception as e:
+            # Unwrap single-error task groups raised by the transport
+            while len(getattr(e, "exceptions", ())) == 1:
+                e = e.exceptions[0]
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            self._sessions[slot] = None
+
+    async def _fetch_manifest(self) -> dict:
+        session = self.session()
+        capabilities = session.get_server_capabilities()
+        manifest: dict = {
+            "tools": [],
+            "prompts": [],
+            "resources": [],
+            "resource_templates": [],
+        }
+
+        def dump(items):
+            return [
+                item.model_dump(mode="json", exclude_none=True)
+                for item in items
+            ]
+
+        if capabilities and capabilities.tools:
+            manifest["tools"] = dump((await session.list_tools()).tools)
+        if capabilities and capabilities.prompts:
+            manifest["prompts"] = dump((await session.list_prompts()).prompts)
+        if capabilities and capabilities.resources:
+            manifest["resources"] = dump(
+                (await session.list_resources()).resources
+            )
+            manifest["resource_templates"] = dump(
+                (await session.list_resource_templates()).resourceTemplates
+            )
+        return manifest
+
+    async def _update_manifest(self):
+        manifest = await self._fetch_manifest()
+        previous, self._manifest = self._manifest, manifest
+        if manifest == previous:
+            return
+        save_manifest(self._manifest_key, manifest)
+        if previous is not None and manifest["tools"] != previous["tools"]:
+            # Tools were advertised from a stale manifest
+            await self._handle_message(
+                types.ServerNotification(
+                    types.ToolListChangedNotification(
+                        method="notifications/tools/list_changed"
+                    )
+                )
+            )
+
+    @property
+    def connected(self) -> bool:
+        return self._session is not None
+
+    async def start(self):
+        """Connects now, unless the client is lazy and has a manifest."""
+        if self._manifest is not None:
+            return
+        await self.connect()
+
+    async def _ensure_connected(self):
+        if not self._runners and self._manifest is not None:
+            async with self._connect_lock:
+                if not self._runners:
+                    await self.connect()
+
+    async def _start_slot(self, slot: int):
+        ready = asyncio.get_running_loop().create_future()
+        self._runners[slot] = asyncio.create_task(self._run(ready, slot))
+        await ready
+
+    async def connect(self):
+        self._closing.clear()
+        self._runners = [None] * self._pool_size
+        try:
+            await asyncio.gather(
+                *(self._start_slot(slot) for slot in range(self._pool_size))
+            )
+        except BaseException:
+            # Shutting the transport down can take a while; cleanup()
+            # waits for it so a failed start does not delay the caller.
+            for runner in self._runners:
+                if runner:
+                    runner.cancel()
+            raise
+
+        if self._health_check_interval and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+        if self._manifest_key:
+            await self._update_manifest()
+
+    async def _reconnect(self, slot: int):
+        start = time.perf_counter()
+        runner = self._runners[slot]
+        if runner:
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+
+        backoff = 0.5
+        error: Optional[BaseException] = None
+        for _ in range(self._max_reconnect_attempts):
+            try:
+                await self._start_slot(slot)
+            except Exception as e:
+                error = e
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self._max_reconnect_backoff)
+                continue
+            self.stats["reconnects"] += 1
+            if slot == 0 and self._resource_cache:
+                # Subscriptions do not survive the old session
+                self._resource_cache.clear()
+                self._subscribed.clear()
+            self.stats["last_reconnect_seconds"] = time.perf_counter() - start
+            return
+
+        self.stats["failed_reconnects"] += 1
+        print(
+            f"Could not reconnect to {self.name} after "
+            f"{self._max_reconnect_attempts} attempts: {error}"
+        )
+
+    def _schedule_reconnect(self, slot: int) -> asyncio.Task:
+        """Starts reopening a session unless that is already under way."""
+        task = self._reconnect_tasks.get(slot)
+        if task is None or task.done():
+            self._sessions[slot] = None
+            task = asyncio.create_task(self._reconnect(slot))
+            self._reconnect_tasks[slot] = task
+        return task
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self._health_check_interval)
+            for slot, session in enumerate(self._sessions):
+                task = self._reconnect_tasks.get(slot)
+                if task and not task.done():
+                    continue
+                try:
+                    if session is None:
+                        raise ConnectionError("Session is closed")
+                    await asyncio.wait_for(
+                        session.send_ping(),
+                        timeout=self._health_check_interval,
+                    )
+                except Exception:
+                    self._schedule_reconnect(slot)
+
+    @asynccontextmanager
+    async def _routed_session(self, primary: bool = False):
+        """Yields the slot and live session with the fewest requests in
+        flight, waiting for a reconnect if no session is live."""
+        await self._ensure_connected()
+        slots = [0] if primary else range(self._pool_size)
+        live = [i for i in slots if self._sessions[i] is not None]
+        if not live:
+            pending = [
+                self._reconnect_tasks[i]
+                for i in slots
+                if i in self._reconnect_tasks
+            ]
+            await asyncio.gather(*pending)
+            live = [i for i in slots if self._sessions[i] is not None]
+        if not live:
+            self.session()  # raises ConnectionError
+
+        slot = min(live, key=lambda i: self._outstanding[i])
+        self._outstanding[slot] += 1
+        try:
+            yield slot, self._sessions[slot]
+        finally:
+            self._outstanding[slot] -= 1
+
+    async def _request(
+        self,
+        method: str,
+        send,
+        name: str = "",
+        params: Any = None,
+        idempotent: bool = True,
+        primary: bool = False,
+    ):
+        """Sends a request in a client span, recording its latency and
+        payload sizes when metrics are enabled."""
+        with tracing.span(
+            f"mcp.{method}",
+            kind=tracing.CLIENT,
+            server=self.name,
+            target=name or None,
+        ):
+            return await self._measured_request(
+                method, send, name, params, idempotent, primary
+            )
+
+    async def _measured_request(
+        self,
+        method: str,
+        send,
+        name: str,
+        params: Any,
+        idempotent: bool,
+        primary: bool,
+    ):
+        if self._metrics is None:
+            return await self._send(send, idempotent, primary)
+
+        start = time.perf_counter()
+        result = None
+        error = True
+        try:
+            result = await self._send(send, idempotent, primary)
+            error = bool(getattr(result, "isError", False))
+            return result
+        finally:
+            self._metrics.record(
+                self.name,
+                method,
+                name,
+                time.perf_counter() - start,
+                len(json.dumps(params, default=str)) if params else 0,
+                len(result.model_dump_json()) if result else 0,
+                error,
+            )
+
+    async def _send(self, send, idempotent: bool, primary: bool):
+        """Sends a request, reconnecting and retrying idempotent requests
+        that fail because the transport is gone."""
+        retries = 0
+        while True:
+            async with self._routed_session(primary) as (slot, session):
+                try:
+                    return await send(session)
+                except Exception as e:
+                    if not _is_transport_error(e):
+                        raise
+                    if self._sessions[slot] is session:
+                        self._schedule_reconnect(slot)
+                    if not idempotent or retries >= self._max_retries:
+                        raise
+            retries += 1
+            self.stats["retries"] += 1
 
     def session(self) -> ClientSession:
         if self._session is None:
@@ -66,39 +513,167 @@ class MCPClient:
     #     # TODO: Read a resource, parse the contents and return it
     #     return []
 
+    def _index_tool_annotations(self, tools: list[types.Tool]):
+        self._read_only_tools = {
+            tool.name
+            for tool in tools
+            if tool.annotations and tool.annotations.readOnlyHint
+        }
+        # Tools the server marks read-only or idempotent are safe to retry
+        self._idempotent_tools = self._read_only_tools | {
+            tool.name
+            for tool in tools
+            if tool.annotations and tool.annotations.idempotentHint
+        }
+
     async def list_tools(self) -> list[types.Tool]:
-        result = await self.session().list_tools()
-        return result.tools
+        if self._session is None and self._manifest is not None:
+            tools = [
+                types.Tool.model_validate(t) for t in self._manifest["tools"]
+            ]
+        else:
+            result = await self._request(
+                "list_tools",
+                lambda session: session.list_tools(),
+                primary=True,
+            )
+            tools = result.tools
+        self._index_tool_annotations(tools)
+        return tools
 
     async def call_tool(
         self, tool_name: str, tool_input
     ) -> types.CallToolResult | None:
-        return await self.session().call_tool(tool_name, tool_input)
+        # The tool may change resources and no update will be sent. Reads
+        # made while it runs may cache the old content, so the cache is
+        # cleared again once it returns.
+        invalidates = (
+            self._resource_cache is not None
+            and tool_name not in self._read_only_tools
+            and not self._supports_subscriptions()
+        )
+        if invalidates:
+            self._resource_cache.clear()
+        try:
+            return await self._request(
+                "call_tool",
+                lambda session: session.call_tool(
+                    tool_name, tool_input, meta=_trace_meta()
+                ),
+                name=tool_name,
+                params=tool_input,
+                idempotent=tool_name in self._idempotent_tools,
+            )
+        finally:
+            if invalidates:
+                self._resource_cache.clear()
 
     async def list_prompts(self) -> list[types.Prompt]:
-        result = await self.session().list_prompts()
+        if self._session is None and self._manifest is not None:
+            return [
+                types.Prompt.model_validate(p)
+                for p in self._manifest["prompts"]
+            ]
+        result = await self._request(
+            "list_prompts",
+            lambda session: session.list_prompts(),
+            primary=True,
+        )
         return result.prompts
 
     async def get_prompt(self, prompt_name, args: dict[str, str]):
-        result = await self.session().get_prompt(prompt_name, args)
+        result = await self._request(
+            "get_prompt",
+            lambda session: session.get_prompt(prompt_name, args),
+            name=prompt_name,
+            params=args,
+        )
         return result.messages
 
+    def _supports_subscriptions(self) -> bool:
+        capabilities = (
+            self._session.get_server_capabilities() if self._session else None
+        )
+        return bool(
+            capabilities
+            and capabilities.resources
+            and capabilities.resources.subscribe
+        )
+
     async def read_resource(self, uri: str) -> Any:
-        result = await self.session().read_resource(AnyUrl(uri))
-        resource = result.contents[0]
+        contents = await self.read_resource_contents(uri)
+        return contents[0] if contents else None
+
+    async def read_resource_contents(self, uri: str) -> list[Any]:
+        """Reads a resource and returns every content it holds, parsed.
+
+        Batch resources such as docs://documents/batch/{doc_ids} return
+        one content per item, in the order requested."""
+        if self._resource_cache:
+            hit, contents = self._resource_cache.get(uri)
+            if hit:
+                return contents
+
+        result = await self._request(
+            "read_resource",
+            lambda session: session.read_resource(AnyUrl(uri)),
+            name=uri,
+            params={"uri": uri},
+        )
+        contents = [_parse_resource(resource) for resource in result.contents]
 
-        if isinstance(resource, types.TextResourceContents):
-            if resource.mimeType == "application/json":
-                return json.loads(resource.text)
+        if self._resource_cache:
+            subscribed = await self._subscribe(uri)
+            self._resource_cache.put(uri, contents, subscribed)
+        return contents
 
-            return resource.text
+    async def iter_resource(
+        self, uri: str, chunk_size: int = 64 * 1024
+    ) -> AsyncIterator[str | bytes]:
+        """Yields the resource in pieces of about chunk_size characters or
+        bytes, one content after the other, without parsing JSON or
+        decoding a blob in one go. Reads bypass the resource cache."""
+        result = await self._request(
+            "read_resource",
+            lambda session: session.read_resource(AnyUrl(uri)),
+            name=uri,
+            params={"uri": uri},
+        )
+        for resource in result.contents:
+            for chunk in _iter_chunks(resource, chunk_size):
+                yield chunk
+
+    async def _subscribe(self, uri: str) -> bool:
+        """Subscribes to updates of the resource on the primary session."""
+        if uri in self._subscribed:
+            return True
+        if not self._supports_subscriptions():
+            return False
+        try:
+            await self.session().subscribe_resource(AnyUrl(uri))
+        except McpError:
+            return False
+        self._subscribed.add(uri)
+        return True
 
     async def cleanup(self):
-        await self._exit_stack.aclose()
-        self._session = None
+        background = [self._health_task, *self._reconnect_tasks.values()]
+        for task in filter(None, background):
+            task.cancel()
+        await asyncio.gather(*filter(None, background), return_exceptions=True)
+        self._health_task = None
+        self._reconnect_tasks = {}
+
+        if self._runners:
+            self._closing.set()
+            await asyncio.gather(
+                *filter(None, self._runners), return_exceptions=True
+            )
+            self._runners = []
+        self._sessions = [None] * self._pool_size
 
     async def __aenter__(self):
-        await self.connect()
+        await self.start()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
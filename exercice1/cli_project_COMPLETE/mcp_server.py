@@ -1,6 +1,44 @@
+import os
+import json
+import base64
+import tracing
+from urllib.parse import parse_qs
+from typing import Optional
+from document_index import DocumentIndex
+from document_store import open_document_store
 from mcp.server.fastmcp import FastMCP
+from mcp.server.lowlevel.helper_types import ReadResourceContents
 
-mcp = FastMCP("DocumentMCP", log_level="ERROR")
+BATCH_URI_PREFIX = "docs://documents/batch/"
+PAGE_URI_PREFIX = "docs://documents/page/"
+MAX_PAGE_SIZE = 1000
+
+
+class DocumentMCP(FastMCP):
+    async def call_tool(self, name, arguments):
+        # Continue the trace of the client that made the request
+        meta = self.get_context().request_context.meta
+        with tracing.span(
+            f"tool.{name}",
+            kind=tracing.SERVER,
+            traceparent=getattr(meta, "traceparent", None),
+        ):
+            return await super().call_tool(name, arguments)
+
+    async def read_resource(self, uri):
+        contents = await super().read_resource(uri)
+        if not str(uri).startswith(BATCH_URI_PREFIX):
+            return contents
+
+        # Return each document of a batch read as its own content
+        (batch,) = contents
+        return [
+            ReadResourceContents(content=text, mime_type="text/plain")
+            for text in json.loads(batch.content)
+        ]
+
+
+mcp = DocumentMCP("DocumentMCP", log_level="ERROR")
 
 
 docs = {
@@ -12,6 +50,10 @@ docs = {
     "spec.txt": "These specifications define the technical requirements for the equipment.",
 }
 
+# Documents live in an SQLite database at DOCUMENT_DB, seeded with the docs
+# above when it is created, or in memory when it is unset
+store = open_document_store(os.getenv("DOCUMENT_DB", ""), seed=docs)
+
 # TODO: Write a tool to read a doc
 # TODO: Write a tool to edit a doc
 # TODO: Write a resource to return all doc id's
@@ -20,21 +62,167 @@ docs = {
 # TODO: Write a prompt to summarize a doc
 
 
-from pydantic import Field
+from pydantic import BaseModel, Field
 from mcp.server.fastmcp.prompts import base
+from mcp.types import ToolAnnotations
+
+
+def _parse_range(spec: str) -> tuple[int, Optional[int]]:
+    """Parses "first-last", "first-" or "first", with last inclusive."""
+    first, dash, last = spec.partition("-")
+    try:
+        if not dash:
+            return int(first), int(first)
+        return int(first or 0), int(last) if last.strip() else None
+    except ValueError:
+        raise ValueError(f"Invalid range {spec!r}")
+
+
+def _char_offset(doc_id: str, index: DocumentIndex, offset: int) -> int:
+    """The character at a UTF-8 byte offset, or the one it falls inside."""
+    if offset >= index.size:
+        return index.length
+    line = index.line_at_byte(max(offset, 0))
+    start, end = index.lines(line, line)
+    head = store.read(doc_id, start, end).encode()
+    head = head[: offset - index.line_bytes[line - 1]]
+    return start + len(head.decode(errors="ignore"))
+
+
+def read_range(
+    doc_id: str,
+    line_range: str = "",
+    byte_range: str = "",
+    section: str = "",
+    max_chars: int = 0,
+    cursor: str = "",
+) -> dict:
+    """Reads part of a document, located through its line and section
+    index, and returns the text with the lines it spans and a cursor to
+    the rest when it was cut at max_chars."""
+    index = store.index(doc_id)
+    if index is None:
+        raise ValueError(f"Doc with id {doc_id} not found")
+
+    if cursor:
+        state = _decode_cursor(cursor)
+        if not isinstance(state, dict) or not {
+            "doc_id", "version", "start", "end", "max_chars"
+        } <= state.keys():
+            raise ValueError(f"Invalid cursor {cursor!r}")
+        if state["doc_id"] != doc_id:
+            raise ValueError(
+                f"Cursor was returned for doc {state['doc_id']}, "
+                f"not {doc_id}"
+            )
+        if state["version"] != store.version(doc_id):
+            raise ValueError(
+                f"Doc with id {doc_id} changed since the cursor was "
+                "returned, read it again"
+            )
+        start, end = state["start"], state["end"]
+        # Later chunks keep the size of the first unless one is given
+        max_chars = max_chars or state["max_chars"]
+    elif len([s for s in (line_range, byte_range, section) if s]) > 1:
+        raise ValueError(
+            "Give only one of line_range, byte_range and section"
+        )
+    elif line_range:
+        start, end = index.lines(*_parse_range(line_range))
+    elif byte_range:
+        first, last = _parse_range(byte_range)
+        start = _char_offset(doc_id, index, first)
+        end = (
+            _char_offset(doc_id, index, last + 1)
+            if last is not None
+            else index.length
+        )
+    elif section:
+        span = index.section(section)
+        if span is None:
+            titles = [title for _, title, _, _ in index.sections]
+            headings = ", ".join(titles[:50]) + (
+                ", …" if len(titles) > 50 else ""
+            )
+            raise ValueError(
+                f"No section {section!r} in doc {doc_id}. "
+                f"Its sections are: {headings or 'none'}"
+            )
+        start, end = span
+    else:
+        start, end = 0, index.length
+
+    stop = index.chunk_end(start, end, max_chars) if max_chars > 0 else end
+    first_line = index.line_at(start)
+    last_line = max(index.line_at(stop - 1), first_line)
+    return {
+        "content": store.read(doc_id, start, stop),
+        "lines": f"{first_line}-{last_line}",
+        "next_cursor": (
+            _encode_cursor(
+                {
+                    "doc_id": doc_id,
+                    "version": store.version(doc_id),
+                    "start": stop,
+                    "end": end,
+                    "max_chars": max_chars,
+                }
+            )
+            if stop < end
+            else None
+        ),
+    }
 
 
 @mcp.tool(
     name="read_doc_contents",
-    description="Read the contents of a document and return it as a string.",
+    description="Read the contents of a document and return it as a "
+    "string. For long documents, read only part of it by giving one of "
+    "line_range, byte_range or section, and set max_chars to read it in "
+    "chunks. With any of these the result is a JSON object with the "
+    "content, the lines it spans and a next_cursor; pass next_cursor back "
+    "as cursor to read the next chunk until it is null.",
+    annotations=ToolAnnotations(readOnlyHint=True),
 )
 def read_document(
     doc_id: str = Field(description="Id of the document to read"),
+    line_range: str = Field(
+        default="",
+        description='Lines to read, numbered from 1, as "10-20", "10-" '
+        'or "10"',
+    ),
+    byte_range: str = Field(
+        default="",
+        description='UTF-8 byte offsets to read, as "0-4095" or "4096-"',
+    ),
+    section: str = Field(
+        default="",
+        description="Heading of a Markdown section to read, including "
+        "its subsections",
+    ),
+    max_chars: int = Field(
+        default=0,
+        description="Maximum number of characters to return, 0 for no "
+        "limit. Chunks end at a line break where possible.",
+    ),
+    cursor: str = Field(
+        default="",
+        description="next_cursor from the previous chunk. The chunks "
+        "keep its max_chars unless another is given.",
+    ),
 ):
-    if doc_id not in docs:
-        raise ValueError(f"Doc with id {doc_id} not found")
+    if not (line_range or byte_range or section or max_chars or cursor):
+        content = store.get(doc_id)
+        if content is None:
+            raise ValueError(f"Doc with id {doc_id} not found")
 
-    return docs[doc_id]
+        return content
+
+    return json.dumps(
+        read_range(
+            doc_id, line_range, byte_range, section, max_chars, cursor
+        )
+    )
 
 
 @mcp.tool(
@@ -50,22 +238,150 @@ def edit_document(
         description="The new text to insert in place of the old text"
     ),
 ):
-    if doc_id not in docs:
+    try:
+        (count,) = store.edit(doc_id, [(old_str, new_str)])
+    except KeyError:
+        raise ValueError(f"Doc with id {doc_id} not found")
+
+    return json.dumps({"replacements": count})
+
+
+class Replacement(BaseModel):
+    old_str: str = Field(
+        description="The text to replace. Must match exactly, including whitespace"
+    )
+    new_str: str = Field(
+        description="The new text to insert in place of the old text"
+    )
+
+
+@mcp.tool(
+    name="edit_document_batch",
+    description="Edit a document by applying a list of replacements in "
+    "order, each one to every occurrence of its text. Either every "
+    "replacement is applied or none is. Returns how many occurrences each "
+    "replacement matched.",
+)
+def edit_document_batch(
+    doc_id: str = Field(description="Id of the document that will be edited"),
+    edits: list[Replacement] = Field(
+        description="Replacements to apply, in order"
+    ),
+):
+    try:
+        counts = store.edit(
+            doc_id, [(edit.old_str, edit.new_str) for edit in edits]
+        )
+    except KeyError:
         raise ValueError(f"Doc with id {doc_id} not found")
 
-    docs[doc_id] = docs[doc_id].replace(old_str, new_str)
+    return json.dumps({"replacements": counts})
+
+
+@mcp.tool(
+    name="search_documents",
+    description="Search all documents for words and return the ids of the "
+    "best matching documents, ranked by relevance, each with a snippet of "
+    "the matching text. Use this to find which documents mention a topic "
+    "before reading them.",
+    annotations=ToolAnnotations(readOnlyHint=True),
+)
+def search_documents(
+    query: str = Field(description="Words to search for"),
+    limit: int = Field(
+        default=10, description="Maximum number of documents to return"
+    ),
+):
+    return json.dumps(store.search(query, limit))
 
 
 @mcp.resource("docs://documents", mime_type="application/json")
 def list_docs() -> list[str]:
-    return list(docs.keys())
+    return list(store.ids())
+
+
+def _encode_cursor(state) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+
+@mcp.resource(
+    PAGE_URI_PREFIX + "{query}",
+    mime_type="application/json",
+    description="A page of the document listing, with the size in bytes, "
+    "modification time and version of each document. The query is "
+    "URL-encoded and may set limit (default 100, at most "
+    f"{MAX_PAGE_SIZE}), prefix, glob, ids (comma-separated) and the "
+    "cursor returned with the previous page.",
+)
+def list_docs_page(query: str) -> dict:
+    options = {
+        key: values[-1] for key, values in parse_qs(query).items()
+    }
+    limit = min(max(int(options.get("limit", 100)), 1), MAX_PAGE_SIZE)
+    ids = options.get("ids")
+    cursor = options.get("cursor")
+    after = _decode_cursor(cursor) if cursor else ""
+    if not isinstance(after, str):
+        # Such as a read_doc_contents cursor
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    # One entry more than the page tells whether there is a next page
+    entries = store.listing(
+        prefix=options.get("prefix", ""),
+        glob=options.get("glob", ""),
+        ids=ids.split(",") if ids is not None else None,
+        after=after,
+        limit=limit + 1,
+    )
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = _encode_cursor(entries[-1]["id"])
+    return {"documents": entries, "next_cursor": next_cursor}
 
 
 @mcp.resource("docs://documents/{doc_id}", mime_type="text/plain")
 def fetch_doc(doc_id: str) -> str:
-    if doc_id not in docs:
+    content = store.get(doc_id)
+    if content is None:
         raise ValueError(f"Doc with id {doc_id} not found")
-    return docs[doc_id]
+    return content
+
+
+@mcp.resource(
+    BATCH_URI_PREFIX + "{doc_ids}",
+    mime_type="text/plain",
+    description="Contents of several comma-separated documents, in order.",
+)
+def fetch_docs(doc_ids: str) -> list[str]:
+    return [fetch_doc(doc_id) for doc_id in doc_ids.split(",")]
+
+
+@mcp.resource(
+    "docs://documents/{doc_id}/{query}",
+    mime_type="application/json",
+    description="Part of a document. The query is URL-encoded and takes "
+    "the options of the read_doc_contents tool: line_range, byte_range, "
+    "section, max_chars and cursor.",
+)
+def fetch_doc_range(doc_id: str, query: str) -> dict:
+    options = {
+        key: values[-1] for key, values in parse_qs(query).items()
+    }
+    return read_range(
+        doc_id,
+        line_range=options.get("line_range", ""),
+        byte_range=options.get("byte_range", ""),
+        section=options.get("section", ""),
+        max_chars=int(options.get("max_chars", 0)),
+        cursor=options.get("cursor", ""),
+    )
 
 
 @mcp.prompt(
@@ -84,11 +400,21 @@ def format_document(
     </document_id>
 
     Add in headers, bullet points, tables, etc as necessary. Feel free to add in extra text, but don't change the meaning of the report.
-    Use the 'edit_document' tool to edit the document. After the document has been edited, respond with the final version of the doc. Don't explain your changes.
+    Use the 'edit_document_batch' tool to make all of your edits in a single call. After the document has been edited, respond with the final version of the doc. Don't explain your changes.
     """
 
     return [base.UserMessage(prompt)]
 
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    tracing.configure_from_env("DocumentMCP")
+    transport = os.getenv("MCP_TRANSPORT", "stdio")
+    if transport == "streamable-http" and os.getenv("MCP_PORT_FILE"):
+        # Started as a daemon by daemons.py
+        from daemons import serve
+
+        serve(mcp)
+    else:
+        if transport == "streamable-http":
+            mcp.settings.port = int(os.getenv("MCP_PORT", mcp.settings.port))
+        mcp.run(transport=transport)
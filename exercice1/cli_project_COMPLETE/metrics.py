@@ -0,0 +1,146 @@
+import os
+import json
+import bisect
+import asyncio
+from pathlib import Path
+from typing import Optional
+
+# Upper bounds of the latency buckets, in milliseconds
+LATENCY_BUCKETS_MS = [
+    1, 2, 5, 10, 20, 50, 100, 200, 500, 1_000, 2_000, 5_000, 10_000, 30_000
+]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value_ms: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.min = value_ms if self.min is None else min(self.min, value_ms)
+        self.max = value_ms if self.max is None else max(self.max, value_ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th percentile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else None,
+            "min_ms": self.min,
+            "max_ms": self.max,
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "buckets": {
+                f"le_{bound}": count
+                for bound, count in zip(
+                    [*LATENCY_BUCKETS_MS, "inf"], self.counts
+                )
+                if count
+            },
+        }
+
+
+class MethodStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.errors = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "latency": self.latency.to_dict(),
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "errors": self.errors,
+        }
+
+
+class MetricsRegistry:
+    """Latency, payload size and error counts per server, method and name.
+
+    The name is the tool, prompt or resource the request was about, or an
+    empty string for listings."""
+
+    def __init__(self):
+        self._stats: dict[tuple[str, str, str], MethodStats] = {}
+        self._dump_task: Optional[asyncio.Task] = None
+
+    def record(
+        self,
+        server: str,
+        method: str,
+        name: str,
+        seconds: float,
+        request_bytes: int,
+        response_bytes: int,
+        error: bool,
+    ):
+        key = (server, method, name)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = MethodStats()
+        stats.latency.observe(seconds * 1000)
+        stats.request_bytes += request_bytes
+        stats.response_bytes += response_bytes
+        stats.errors += error
+
+    def query(
+        self,
+        server: Optional[str] = None,
+        method: Optional[str] = None,
+        name: Optional[str] = None,
+    ) -> list[dict]:
+        """Returns the entries matching every filter that is given."""
+        return [
+            {
+                "server": key[0],
+                "method": key[1],
+                "name": key[2],
+                **stats.to_dict(),
+            }
+            for key, stats in self._stats.items()
+            if (server is None or key[0] == server)
+            and (method is None or key[1] == method)
+            and (name is None or key[2] == name)
+        ]
+
+    def dump(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self.query(), indent=2))
+        os.replace(tmp_path, path)
+
+    def start_periodic_dump(self, path: Path, interval: float):
+        async def dump_loop():
+            while True:
+                await asyncio.sleep(interval)
+                self.dump(path)
+
+        if self._dump_task is None:
+            self._dump_task = asyncio.create_task(dump_loop())
+
+    async def stop_periodic_dump(self, path: Optional[Path] = None):
+        if self._dump_task:
+            self._dump_task.cancel()
+            await asyncio.gather(self._dump_task, return_exceptions=True)
+            self._dump_task = None
+        if path:
+            self.dump(path)
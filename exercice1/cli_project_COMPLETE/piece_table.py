@@ -0,0 +1,178 @@
+from typing import Iterator, Optional
+
+# Edits past this many pieces collapse the table back into one buffer
+MAX_PIECES = 4096
+
+
+def _tail(spans: list, i: int, count: int) -> str:
+    """The last count characters up to the end of piece i."""
+    parts = []
+    while i >= 0 and count > 0:
+        _, buffer, start, end = spans[i]
+        take = min(count, end - start)
+        parts.append(buffer[end - take : end])
+        count -= take
+        i -= 1
+    return "".join(reversed(parts))
+
+
+def _head(spans: list, i: int, count: int) -> str:
+    """The first count characters from the start of piece i."""
+    parts = []
+    while i < len(spans) and count > 0:
+        _, buffer, start, end = spans[i]
+        take = min(count, end - start)
+        parts.append(buffer[start : start + take])
+        count -= take
+        i += 1
+    return "".join(parts)
+
+
+class PieceTable:
+    """Text stored as pieces of immutable buffers.
+
+    Replacing text appends the new text as a buffer and splits the pieces
+    around it, so an edit costs time in the number of pieces rather than
+    in the length of the document. The text itself is only joined when it
+    is read, and kept until the next edit."""
+
+    def __init__(self, text: str = ""):
+        self._buffers: list[str] = [text]
+        # (buffer index, start in buffer, length)
+        self._pieces: list[tuple[int, int, int]] = (
+            [(0, 0, len(text))] if text else []
+        )
+        self._length = len(text)
+        self._text: Optional[str] = text
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        if self._text is None:
+            self._text = "".join(
+                self._buffers[buffer][start : start + length]
+                for buffer, start, length in self._pieces
+            )
+        return self._text
+
+    def copy(self) -> "PieceTable":
+        table = PieceTable.__new__(PieceTable)
+        # The buffers themselves are shared, but not the list of them, so
+        # text added to a copy that is then discarded goes with it
+        table._buffers = list(self._buffers)
+        table._pieces = list(self._pieces)
+        table._length = self._length
+        table._text = self._text
+        return table
+
+    def _spans(self) -> Iterator[tuple[int, str, int, int]]:
+        """Yields (document offset, buffer, start, end) for each piece."""
+        offset = 0
+        for buffer, start, length in self._pieces:
+            yield offset, self._buffers[buffer], start, start + length
+            offset += length
+
+    def find_all(self, sub: str) -> list[int]:
+        """Offsets of the non-overlapping occurrences of sub, left to
+        right, as str.replace would replace them."""
+        if not sub:
+            raise ValueError("Cannot search for an empty string")
+        if self._text is not None:
+            found = []
+            position = self._text.find(sub)
+            while position != -1:
+                found.append(position)
+                position = self._text.find(sub, position + len(sub))
+            return found
+
+        size = len(sub)
+        spans = list(self._spans())
+        matches = set()
+        for i, (offset, buffer, start, end) in enumerate(spans):
+            # Occurrences inside the piece, searched in place
+            position = buffer.find(sub, start, end)
+            while position != -1:
+                matches.add(offset + position - start)
+                position = buffer.find(sub, position + 1, end)
+
+            # Occurrences crossing the boundary after the piece, found in
+            # the size - 1 characters on either side of it
+            if size > 1 and i + 1 < len(spans):
+                boundary = offset + end - start
+                tail = _tail(spans, i, size - 1)
+                window = tail + _head(spans, i + 1, size - 1)
+                lo = boundary - len(tail)
+                position = window.find(sub)
+                while position != -1:
+                    if lo + position < boundary < lo + position + size:
+                        matches.add(lo + position)
+                    position = window.find(sub, position + 1)
+
+        found = []
+        next_free = 0
+        for position in sorted(matches):
+            if position >= next_free:
+                found.append(position)
+                next_free = position + size
+        return found
+
+    def _splice(self, ranges: list[tuple[int, int]], text: str):
+        """Replaces each of the sorted, disjoint (start, end) ranges with
+        text in a single pass over the pieces."""
+        inserted = None
+        if text:
+            self._buffers.append(text)
+            inserted = (len(self._buffers) - 1, 0, len(text))
+
+        pieces = []
+        spans = iter(self._pieces)
+        piece = next(spans, None)
+        piece_offset = 0
+        cursor = 0
+
+        def keep_until(end: int):
+            # Copies the document from cursor to end into the new pieces
+            nonlocal piece, piece_offset, cursor
+            while piece is not None and cursor < end:
+                buffer, start, length = piece
+                piece_end = piece_offset + length
+                if piece_end <= cursor:
+                    piece_offset = piece_end
+                    piece = next(spans, None)
+                    continue
+                lo = cursor - piece_offset
+                hi = min(end, piece_end) - piece_offset
+                pieces.append((buffer, start + lo, hi - lo))
+                cursor = piece_offset + hi
+
+        for start, end in ranges:
+            keep_until(start)
+            if inserted:
+                pieces.append(inserted)
+            cursor = end
+        keep_until(self._length)
+
+        self._pieces = pieces
+        self._length += sum(
+            len(text) - (end - start) for start, end in ranges
+        )
+        self._text = None
+        if len(self._pieces) > MAX_PIECES:
+            text = str(self)
+            self._buffers = [text]
+            self._pieces = [(0, 0, len(text))]
+
+    def replace(self, start: int, end: int, text: str):
+        self._splice([(start, end)], text)
+
+    def replace_all(self, old: str, new: str) -> int:
+        """Replaces every occurrence of old and returns how many there
+        were."""
+        positions = self.find_all(old)
+        if positions:
+            self._splice(
+                [(position, position + len(old)) for position in positions],
+                new,
+            )
+        return len(positions)
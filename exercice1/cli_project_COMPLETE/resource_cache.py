@@ -0,0 +1,51 @@
+import time
+from typing import Any, Optional
+from collections import OrderedDict
+
+
+class ResourceCache:
+    """Size-bounded LRU of parsed resource contents, keyed by URI.
+
+    Entries read from servers that support subscriptions never expire and
+    are dropped when the server reports an update; other entries expire
+    after the TTL, and are not cached at all without one."""
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[Optional[float], Any]] = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uri: str) -> tuple[bool, Any]:
+        entry = self._entries.get(uri)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or time.monotonic() < expires_at:
+                self._entries.move_to_end(uri)
+                self.hits += 1
+                return True, value
+            del self._entries[uri]
+        self.misses += 1
+        return False, None
+
+    def put(self, uri: str, value: Any, subscribed: bool):
+        if subscribed:
+            expires_at = None
+        elif self.ttl:
+            expires_at = time.monotonic() + self.ttl
+        else:
+            return
+
+        self._entries[uri] = (expires_at, value)
+        self._entries.move_to_end(uri)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, uri: str):
+        self._entries.pop(uri, None)
+
+    def clear(self):
+        self._entries.clear()
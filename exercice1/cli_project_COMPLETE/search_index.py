@@ -0,0 +1,86 @@
+import re
+import math
+import heapq
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"\w+")
+SNIPPET_TOKENS = 16
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def snippet(text: str, terms: set[str]) -> str:
+    """About SNIPPET_TOKENS tokens of text around the first query term."""
+    matches = list(TOKEN_PATTERN.finditer(text))
+    if not matches:
+        return ""
+    first = next(
+        (i for i, m in enumerate(matches) if m.group().lower() in terms), 0
+    )
+    start = max(first - SNIPPET_TOKENS // 4, 0)
+    end = min(start + SNIPPET_TOKENS, len(matches))
+    return (
+        ("…" if start > 0 else "")
+        + text[matches[start].start() : matches[end - 1].end()]
+        + ("…" if end < len(matches) else "")
+    )
+
+
+class InvertedIndex:
+    """In-memory inverted index ranking documents with BM25.
+
+    Documents are added, replaced and removed one at a time, touching only
+    the postings of their own terms."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> doc id -> term frequency
+        self._postings: dict[str, dict[str, int]] = {}
+        self._lengths: dict[str, int] = {}
+        self._terms: dict[str, list[str]] = {}
+        self._total_length = 0
+
+    def add(self, doc_id: str, text: str):
+        self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, frequency in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+        self._terms[doc_id] = list(counts)
+        self._lengths[doc_id] = sum(counts.values())
+        self._total_length += self._lengths[doc_id]
+
+    def remove(self, doc_id: str):
+        for term in self._terms.pop(doc_id, []):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id, 0)
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        """Returns up to limit (doc id, score) pairs, best first, for the
+        documents containing any term of the query."""
+        if not self._lengths:
+            return []
+        count = len(self._lengths)
+        average_length = self._total_length / count or 1
+        scores: Counter = Counter()
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term, {})
+            idf = math.log(
+                1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for doc_id, frequency in postings.items():
+                norm = 1 - self.b + self.b * (
+                    self._lengths[doc_id] / average_length
+                )
+                scores[doc_id] += (
+                    idf
+                    * frequency
+                    * (self.k1 + 1)
+                    / (frequency + self.k1 * norm)
+                )
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,113 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from mcp.types import Tool, ToolAnnotations
+from core.chat import Chat
+from core.claude import AsyncClaude
+from core.tools import ToolManager
+
+
+class FakeClient:
+    """Serves a read-only and a writing tool that record their calls."""
+
+    def __init__(self):
+        self.calls = []
+        self.cancelled = []
+
+    def add_notification_handler(self, handler):
+        pass
+
+    async def list_tools(self) -> list[Tool]:
+        return [
+            Tool(
+                name="read",
+                inputSchema={"type": "object"},
+                annotations=ToolAnnotations(readOnlyHint=True),
+            ),
+            Tool(name="write", inputSchema={"type": "object"}),
+        ]
+
+    async def call_tool(self, tool_name: str, tool_input):
+        self.calls.append(tool_name)
+        try:
+            await asyncio.sleep(tool_input.get("delay", 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(tool_name)
+            raise
+
+
+class FakeClaude(AsyncClaude):
+    """Streams a fixed response, reporting its tool_use blocks first."""
+
+    def __init__(self, stop_reason: str, *blocks, error=None):
+        self.response = SimpleNamespace(
+            stop_reason=stop_reason, content=list(blocks)
+        )
+        self.error = error
+
+    async def stream(self, messages, tools, on_text, on_tool_use):
+        for block in self.response.content:
+            on_tool_use(block)
+        # Lets the tasks started early begin their calls
+        await asyncio.sleep(0.01)
+        if self.error:
+            raise self.error
+        return self.response
+
+
+def tool_use(name: str, tool_id: str, **tool_input):
+    return SimpleNamespace(
+        type="tool_use", id=tool_id, name=name, input=tool_input
+    )
+
+
+def stream_turn(claude: FakeClaude, client: FakeClient):
+    async def run():
+        manager = ToolManager({"a": client})
+        await manager.refresh()
+        chat = Chat(claude, {"a": client}, tool_manager=manager)
+        try:
+            _, results = await chat._stream_turn([], lambda text: None)
+        finally:
+            # Nothing is left running once the turn has returned
+            assert {
+                task for task in asyncio.all_tasks()
+                if task is not asyncio.current_task()
+            } == set()
+        return results
+
+    return asyncio.run(run())
+
+
+def test_only_read_only_tools_start_before_the_turn_ends():
+    client = FakeClient()
+    results = stream_turn(
+        FakeClaude("end_turn", tool_use("read", "1"), tool_use("write", "2")),
+        client,
+    )
+    assert results is None
+    assert client.calls == ["read"]
+
+
+def test_all_tools_run_when_the_turn_asks_for_them():
+    client = FakeClient()
+    results = stream_turn(
+        FakeClaude("tool_use", tool_use("write", "1"), tool_use("read", "2")),
+        client,
+    )
+    assert [result["tool_use_id"] for result in results] == ["1", "2"]
+    assert sorted(client.calls) == ["read", "write"]
+
+
+def test_early_calls_are_cancelled_when_the_stream_fails():
+    claude = FakeClaude(
+        "tool_use",
+        tool_use("read", "1", delay=10),
+        tool_use("write", "2"),
+        error=RuntimeError("connection lost"),
+    )
+    client = FakeClient()
+    with pytest.raises(RuntimeError, match="connection lost"):
+        stream_turn(claude, client)
+    assert client.calls == ["read"]
+    assert client.cancelled == ["read"]
@@ -0,0 +1,17 @@
+from daemons import daemon_key
+
+
+def test_daemon_key_covers_env_and_script(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    script = tmp_path / "server.py"
+    script.write_text("print('v1')\n")
+
+    key = daemon_key("python", ["server.py"])
+    assert daemon_key("python", ["server.py"], {}) == key
+    assert daemon_key("python", ["server.py"], {"DOCUMENT_DB": "x.db"}) != key
+    assert daemon_key(
+        "python", ["server.py"], {"A": "1", "B": "2"}
+    ) == daemon_key("python", ["server.py"], {"B": "2", "A": "1"})
+
+    script.write_text("print('v2')\n")
+    assert daemon_key("python", ["server.py"]) != key
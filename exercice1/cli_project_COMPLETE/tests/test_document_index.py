@@ -0,0 +1,159 @@
+import json
+import pytest
+import mcp_server
+from document_index import DocumentIndex
+from document_store import MemoryDocumentStore
+
+TEXT = """# Report
+intro é
+## Budget
+cost 😀
+### Details
+line
+## Schedule
+dates
+"""
+
+
+def test_lines():
+    index = DocumentIndex(TEXT)
+    lines = TEXT.split("\n")[:-1]
+    assert index.line_count == len(lines)
+    assert index.size == len(TEXT.encode())
+
+    start, end = index.lines(3, 4)
+    assert TEXT[start:end] == "## Budget\ncost 😀\n"
+    start, end = index.lines(7)
+    assert TEXT[start:end] == "## Schedule\ndates\n"
+    assert index.lines(100, 200) == (len(TEXT), len(TEXT))
+    assert index.line_at(0) == 1
+    assert index.line_at(TEXT.index("dates")) == 8
+
+
+def test_line_byte_offsets():
+    index = DocumentIndex(TEXT)
+    for line, start in enumerate(index.line_starts):
+        assert index.line_bytes[line] == len(TEXT[:start].encode())
+        assert index.line_at_byte(index.line_bytes[line]) == line + 1
+
+
+def test_final_newline_does_not_start_a_line():
+    assert DocumentIndex("a\nb\n").line_count == 2
+    assert DocumentIndex("a\nb").line_count == 2
+    assert DocumentIndex("").line_count == 1
+
+
+def test_sections_include_subsections():
+    index = DocumentIndex(TEXT)
+    assert [(level, title) for level, title, _, _ in index.sections] == [
+        (1, "Report"),
+        (2, "Budget"),
+        (3, "Details"),
+        (2, "Schedule"),
+    ]
+    start, end = index.section("budget")
+    assert TEXT[start:end] == "## Budget\ncost 😀\n### Details\nline\n"
+    start, end = index.section("## Schedule")
+    assert TEXT[start:end] == "## Schedule\ndates\n"
+    assert index.section("Report") == (0, len(TEXT))
+    assert index.section("missing") is None
+
+
+def test_chunk_end_stops_at_line_starts():
+    index = DocumentIndex(TEXT)
+    end = index.chunk_end(0, len(TEXT), 20)
+    assert end <= 20 and TEXT[end - 1] == "\n"
+    assert index.chunk_end(0, len(TEXT), 1000) == len(TEXT)
+    # A line longer than the chunk is cut inside it
+    assert DocumentIndex("x" * 50).chunk_end(0, 50, 20) == 20
+
+
+@pytest.fixture
+def server_store(monkeypatch):
+    store = MemoryDocumentStore({"report.md": TEXT})
+    monkeypatch.setattr(mcp_server, "store", store)
+    return store
+
+
+def test_read_range_by_lines_bytes_and_section(server_store):
+    result = mcp_server.read_range("report.md", line_range="3-4")
+    assert result == {
+        "content": "## Budget\ncost 😀\n",
+        "lines": "3-4",
+        "next_cursor": None,
+    }
+    section = mcp_server.read_range("report.md", section="Budget")
+    assert section["content"].startswith("## Budget")
+    assert section["lines"] == "3-6"
+
+    data = TEXT.encode()
+    start = data.index("cost".encode())
+    result = mcp_server.read_range(
+        "report.md", byte_range=f"{start}-{start + 6}"
+    )
+    # The range ends inside the emoji, which is left out
+    assert result["content"] == "cost "
+
+
+def test_read_range_in_chunks(server_store):
+    chunks, cursor = [], ""
+    while True:
+        result = mcp_server.read_range(
+            "report.md", max_chars=15, cursor=cursor
+        )
+        chunks.append(result["content"])
+        cursor = result["next_cursor"]
+        if cursor is None:
+            break
+    assert "".join(chunks) == TEXT
+    assert len(chunks) > 1
+
+
+def test_read_range_cursor_keeps_chunk_size(server_store):
+    result = mcp_server.read_range("report.md", max_chars=15)
+    chunks = [result["content"]]
+    while result["next_cursor"]:
+        result = mcp_server.read_range(
+            "report.md", cursor=result["next_cursor"]
+        )
+        chunks.append(result["content"])
+    assert "".join(chunks) == TEXT
+    assert all(len(chunk) <= 15 for chunk in chunks)
+
+
+def test_read_range_errors(server_store):
+    with pytest.raises(ValueError, match="sections are: Report"):
+        mcp_server.read_range("report.md", section="Missing")
+    with pytest.raises(ValueError, match="only one"):
+        mcp_server.read_range("report.md", line_range="1", section="x")
+    with pytest.raises(ValueError, match="not found"):
+        mcp_server.read_range("missing")
+
+    cursor = mcp_server.read_range("report.md", max_chars=10)["next_cursor"]
+    server_store.edit("report.md", [("intro", "Intro")])
+    server_store.put("other.md", TEXT)
+    with pytest.raises(ValueError, match="returned for doc report.md"):
+        mcp_server.read_range("other.md", cursor=cursor)
+    with pytest.raises(ValueError, match="changed"):
+        mcp_server.read_range("report.md", cursor=cursor)
+    # A listing cursor, or one not made by the server at all
+    for bad in [mcp_server._encode_cursor("report.md"), "not-a-cursor"]:
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            mcp_server.read_range("report.md", cursor=bad)
+
+
+def test_read_tool_without_options_returns_plain_text(server_store):
+    def read(**options):
+        # Called directly, the Field defaults are not filled in
+        arguments = {
+            "line_range": "",
+            "byte_range": "",
+            "section": "",
+            "max_chars": 0,
+            "cursor": "",
+            **options,
+        }
+        return mcp_server.read_document("report.md", **arguments)
+
+    assert read() == TEXT
+    assert json.loads(read(line_range="1"))["content"] == "# Report\n"
@@ -0,0 +1,118 @@
+import pytest
+from document_store import (
+    MemoryDocumentStore,
+    SqliteDocumentStore,
+    open_document_store,
+)
+
+DOCS = {
+    "report.pdf": "The report details the state of a 20m condenser tower.",
+    "plan.md": "The plan outlines the steps for the project's implementation.",
+    "spec.txt": "These specifications define the technical requirements.",
+    "notes-é.md": "Notes with non-ASCII text: café, naïve, 😀.",
+}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryDocumentStore(DOCS)
+    else:
+        store = SqliteDocumentStore(tmp_path / "docs.db", DOCS)
+    yield store
+    store.close()
+
+
+def test_get_and_put(store):
+    assert store.get("plan.md") == DOCS["plan.md"]
+    assert store.get("missing") is None
+    assert "plan.md" in store
+    assert "missing" not in store
+
+    store.put("new.txt", "fresh")
+    assert store.get("new.txt") == "fresh"
+    assert sorted(store.ids()) == sorted([*DOCS, "new.txt"])
+
+
+def test_versions_go_up_on_writes(store):
+    assert store.version("plan.md") == 1
+    store.put("plan.md", "rewritten")
+    assert store.version("plan.md") == 2
+    store.edit("plan.md", [("rewritten", "edited")])
+    assert store.version("plan.md") == 3
+    # An edit that matches nothing is not a write
+    store.edit("plan.md", [("absent", "x")])
+    assert store.version("plan.md") == 3
+    assert store.version("missing") is None
+
+
+def test_edit_applies_replacements_in_order(store):
+    counts = store.edit(
+        "report.pdf", [("The", "A"), ("A report", "This report")]
+    )
+    assert counts == [1, 1]
+    assert store.get("report.pdf").startswith("This report details")
+
+
+def test_edit_is_all_or_nothing(store):
+    with pytest.raises(ValueError):
+        store.edit("plan.md", [("plan", "PLAN"), ("", "x")])
+    assert store.get("plan.md") == DOCS["plan.md"]
+    assert store.version("plan.md") == 1
+
+
+def test_edit_missing_document(store):
+    with pytest.raises(KeyError):
+        store.edit("missing", [("a", "b")])
+
+
+def test_read_range(store):
+    text = DOCS["notes-é.md"]
+    assert store.read("notes-é.md", 5, 20) == text[5:20]
+    assert store.read("notes-é.md", 0, 1000) == text
+    with pytest.raises(KeyError):
+        store.read("missing", 0, 1)
+
+
+def test_index_is_rebuilt_after_an_edit(store):
+    store.put("doc.md", "# A\none\n# B\ntwo")
+    index = store.index("doc.md")
+    assert store.index("doc.md") is index
+    store.edit("doc.md", [("# B", "# C")])
+    assert store.index("doc.md") is not index
+    assert store.index("doc.md").section("c") is not None
+    assert store.index("missing") is None
+
+
+def test_search_ranks_matching_documents(store):
+    results = store.search("condenser tower")
+    assert [result["id"] for result in results] == ["report.pdf"]
+    assert "condenser" in results[0]["snippet"]
+    assert store.search("!!!") == []
+
+
+def test_search_sees_edits(store):
+    store.edit("spec.txt", [("technical", "condenser")])
+    ids = {result["id"] for result in store.search("condenser")}
+    assert ids == {"report.pdf", "spec.txt"}
+
+
+def test_sqlite_store_persists_edits(tmp_path):
+    path = tmp_path / "docs.db"
+    store = SqliteDocumentStore(path, DOCS)
+    store.edit("plan.md", [("plan", "PLAN")])
+    store.close()
+
+    # The seed is only used when the database is created
+    reopened = SqliteDocumentStore(path, {"other.md": "ignored"})
+    assert "PLAN" in reopened.get("plan.md")
+    assert reopened.version("plan.md") == 2
+    assert "other.md" not in reopened
+    reopened.close()
+
+
+def test_open_document_store(tmp_path):
+    assert isinstance(open_document_store("", DOCS), MemoryDocumentStore)
+    store = open_document_store(str(tmp_path / "docs.db"), DOCS)
+    assert isinstance(store, SqliteDocumentStore)
+    store.close()
@@ -0,0 +1,119 @@
+from core.history import HistoryCompactor
+
+
+def query(text: str) -> dict:
+    return {"role": "user", "content": f"<query>\n{text}\n</query>"}
+
+
+def tool_turn(name: str, result: str) -> list[dict]:
+    return [
+        {
+            "role": "assistant",
+            "content": [
+                {"type": "tool_use", "id": name, "name": name, "input": {}}
+            ],
+        },
+        {
+            "role": "user",
+            "content": [
+                {"type": "tool_result", "tool_use_id": name, "content": result}
+            ],
+        },
+        {"role": "assistant", "content": f"Answer from {name}"},
+    ]
+
+
+def is_paired(messages: list[dict]) -> bool:
+    """Every tool_result follows the tool_use it answers."""
+    for i, message in enumerate(messages):
+        if isinstance(message["content"], str):
+            continue
+        for block in message["content"]:
+            if block.get("type") != "tool_result":
+                continue
+            previous = messages[i - 1]["content"] if i else []
+            if not any(
+                isinstance(b, dict) and b.get("id") == block["tool_use_id"]
+                for b in previous
+            ):
+                return False
+    return True
+
+
+def history(turns: int, result_size: int = 4000) -> list[dict]:
+    messages = []
+    for i in range(turns):
+        messages.append(query(f"question {i}"))
+        messages += tool_turn(f"t{i}", "r" * result_size)
+    return messages
+
+
+def test_history_under_budget_is_unchanged():
+    messages = history(3, result_size=10)
+    assert HistoryCompactor(token_budget=10_000).compact(messages) is messages
+
+
+def test_tool_results_are_elided_first():
+    messages = history(4)
+    compactor = HistoryCompactor(token_budget=2_500, keep_recent_turns=1)
+    compacted = compactor.compact(messages)
+
+    assert len(compacted) == len(messages)
+    assert compactor.estimate_tokens(compacted) <= 2_500
+    elided = compacted[2]["content"][0]["content"]
+    assert elided.startswith("[tool result elided")
+    # The most recent turn is kept as it was
+    assert compacted[-4:] == messages[-4:]
+
+
+def test_documents_are_collapsed_into_references():
+    document = '<document id="plan.md">\n' + "x" * 4000 + "\n</document>"
+    messages = [
+        {"role": "user", "content": f"<query>\nq\n</query>\n{document}"},
+        {"role": "assistant", "content": "a"},
+        query("recent"),
+        {"role": "assistant", "content": "b"},
+    ]
+    compacted = HistoryCompactor(
+        token_budget=200, keep_recent_turns=1
+    ).compact(messages)
+    assert '<document id="plan.md" />' in compacted[0]["content"]
+    assert "x" * 100 not in compacted[0]["content"]
+
+
+def test_old_turns_are_folded_into_a_summary():
+    messages = []
+    for i in range(6):
+        messages += [query(f"question {i} " + "q" * 2000)]
+        messages += [{"role": "assistant", "content": f"answer {i}"}]
+    compactor = HistoryCompactor(token_budget=1_600, keep_recent_turns=2)
+    compacted = compactor.compact(messages)
+
+    assert compactor.estimate_tokens(compacted) <= 1_600
+    assert compacted[-2:] == messages[-2:]
+    summary = compacted[0]["content"][0]["text"]
+    assert summary.startswith("<conversation_summary>")
+    assert "- User: question 0" in summary
+    assert "- Assistant: answer 0" in summary
+
+
+def test_compaction_keeps_tool_pairs_together():
+    messages = history(6)
+    for budget in [6_000, 3_000, 1_000, 100]:
+        compacted = HistoryCompactor(
+            token_budget=budget, keep_recent_turns=2
+        ).compact(messages)
+        assert is_paired(compacted)
+        assert compacted[0]["role"] == "user"
+
+
+def test_elided_results_are_not_elided_again():
+    compactor = HistoryCompactor(token_budget=2_500, keep_recent_turns=1)
+    compacted = compactor.compact(history(4))
+    elided = compacted[2]["content"][0]["content"]
+    assert elided == "[tool result elided: 4002 chars]"
+
+    # Later turns push the compacted history over the budget again
+    again = compactor.compact(compacted + history(2))
+    # Turns elided the first time come out exactly as they went in
+    assert again[:12] == compacted[:12]
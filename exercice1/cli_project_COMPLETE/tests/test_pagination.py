@@ -0,0 +1,126 @@
+import random
+from fnmatch import fnmatchcase
+import pytest
+import mcp_server
+from document_store import MemoryDocumentStore, SqliteDocumentStore
+
+IDS = [
+    *(f"report-{i}.pdf" for i in range(60)),
+    *(f"plan-{i}.md" for i in range(60)),
+    *(f"Plan-{i}.txt" for i in range(60)),
+    "é-notes.md",
+    "z",
+]
+DOCS = {doc_id: f"Contents of {doc_id}" for doc_id in IDS}
+FILTERS = [
+    {},
+    {"prefix": "plan"},
+    {"prefix": "Plan-1"},
+    {"glob": "*.md"},
+    {"glob": "report-?.pdf"},
+    {"prefix": "report", "glob": "*5*"},
+    {"prefix": "nothing"},
+    {"ids": ["z", "plan-3.md", "missing", "report-10.pdf"]},
+]
+
+
+def page_through(store, limit: int, **filters) -> list[str]:
+    ids, after = [], ""
+    while True:
+        page = store.listing(after=after, limit=limit, **filters)
+        ids += [entry["id"] for entry in page]
+        if len(page) < limit:
+            return ids
+        after = page[-1]["id"]
+
+
+def expected(prefix="", glob="", ids=None) -> list[str]:
+    return sorted(
+        doc_id
+        for doc_id in IDS
+        if doc_id.startswith(prefix)
+        and (not glob or fnmatchcase(doc_id, glob))
+        and (ids is None or doc_id in ids)
+    )
+
+
+@pytest.fixture
+def stores(tmp_path):
+    memory = MemoryDocumentStore(DOCS)
+    sqlite = SqliteDocumentStore(tmp_path / "docs.db", DOCS)
+    yield memory, sqlite
+    sqlite.close()
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("limit", [1, 7, 1000])
+def test_stores_page_identically(stores, filters, limit):
+    memory, sqlite = stores
+    listed = page_through(memory, limit, **filters)
+    assert listed == expected(**filters)
+    assert page_through(sqlite, limit, **filters) == listed
+
+
+def test_listing_metadata_matches_between_stores(stores):
+    edited = random.Random(0).sample(IDS, 10)
+    for store in stores:
+        for doc_id in edited:
+            store.edit(doc_id, [("Contents", "Contenu édité 😀")])
+        store.put("added", "new")
+
+    memory, sqlite = (
+        {entry["id"]: entry for entry in store.listing(limit=1000)}
+        for store in stores
+    )
+    assert memory.keys() == sqlite.keys()
+    for doc_id, entry in memory.items():
+        assert entry["size"] == len(stores[0].get(doc_id).encode())
+        assert entry["size"] == sqlite[doc_id]["size"]
+        assert entry["version"] == sqlite[doc_id]["version"]
+
+
+@pytest.fixture
+def server_store(monkeypatch):
+    store = MemoryDocumentStore(DOCS)
+    monkeypatch.setattr(mcp_server, "store", store)
+    return store
+
+
+def test_page_resource_cursors(server_store):
+    ids, cursor = [], None
+    while True:
+        query = "limit=25&glob=%2A.md"
+        if cursor:
+            query += f"&cursor={cursor}"
+        page = mcp_server.list_docs_page(query)
+        assert len(page["documents"]) <= 25
+        ids += [entry["id"] for entry in page["documents"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == expected(glob="*.md")
+
+
+def test_page_resource_clamps_the_limit(server_store, monkeypatch):
+    monkeypatch.setattr(mcp_server, "MAX_PAGE_SIZE", 10)
+    page = mcp_server.list_docs_page("limit=100000")
+    assert len(page["documents"]) == 10
+    assert page["next_cursor"] is not None
+    assert len(mcp_server.list_docs_page("limit=0")["documents"]) == 1
+
+
+def test_page_resource_rejects_bad_cursors(server_store):
+    with pytest.raises(ValueError):
+        mcp_server.list_docs_page("cursor=%21%21")
+    # Valid JSON, but not a listing cursor
+    server_store.put("long.md", "line\n" * 100)
+    read_cursor = mcp_server.read_range("long.md", max_chars=10)[
+        "next_cursor"
+    ]
+    for cursor in [read_cursor, mcp_server._encode_cursor(42)]:
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            mcp_server.list_docs_page(f"cursor={cursor}")
+
+
+def test_plain_listing_still_returns_every_id(server_store):
+    assert mcp_server.list_docs() == IDS
@@ -0,0 +1,79 @@
+import random
+import pytest
+import piece_table
+from piece_table import PieceTable
+
+
+def find_all(text: str, sub: str) -> list[int]:
+    found = []
+    position = text.find(sub)
+    while position != -1:
+        found.append(position)
+        position = text.find(sub, position + len(sub))
+    return found
+
+
+def test_replace_matches_string_slicing():
+    rng = random.Random(0)
+    text = "the quick brown fox"
+    table = PieceTable(text)
+    for _ in range(500):
+        start = rng.randint(0, len(text))
+        end = rng.randint(start, len(text))
+        new = rng.choice(["", "x", "ab", "the ", "éé"])
+        table.replace(start, end, new)
+        text = text[:start] + new + text[end:]
+        assert len(table) == len(text)
+    assert str(table) == text
+
+
+def test_replace_all_matches_str_replace():
+    rng = random.Random(1)
+    text = "abab aab ba " * 20
+    table = PieceTable(text)
+    for _ in range(300):
+        old = rng.choice(["a", "ab", "ba", "b a", "aab", "zz"])
+        new = rng.choice(["", "a", "b", "ab", "xyz"])
+        assert table.replace_all(old, new) == text.count(old)
+        text = text.replace(old, new)
+        assert len(table) == len(text)
+        if rng.random() < 0.2:
+            assert str(table) == text
+    assert str(table) == text
+
+
+def test_find_all_across_piece_boundaries():
+    table = PieceTable("aaaa")
+    table.replace(2, 2, "a")
+    table.replace(1, 1, "b")
+    text = str(table)
+    # Search the pieces rather than the joined text
+    table._text = None
+    for sub in ["a", "aa", "aaa", "ba", "ab", "aba", "c"]:
+        assert table.find_all(sub) == find_all(text, sub)
+
+
+def test_find_all_rejects_empty_string():
+    with pytest.raises(ValueError):
+        PieceTable("text").find_all("")
+
+
+def test_copy_is_independent():
+    table = PieceTable("one two three")
+    copy = table.copy()
+    copy.replace_all("two", "2")
+    assert str(table) == "one two three"
+    assert str(copy) == "one 2 three"
+    # Text added to the copy is not kept alive by the original
+    assert len(table._buffers) == 1
+
+
+def test_many_edits_collapse_into_one_buffer(monkeypatch):
+    monkeypatch.setattr(piece_table, "MAX_PIECES", 8)
+    text = "abcdefghij" * 4
+    table = PieceTable(text)
+    for i in range(0, 30, 3):
+        table.replace(i, i + 1, "X")
+        text = text[:i] + "X" + text[i + 1 :]
+    assert str(table) == text
+    assert len(table._pieces) <= 8
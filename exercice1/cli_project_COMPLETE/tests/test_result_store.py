@@ -0,0 +1,66 @@
+import json
+import pytest
+from core.result_store import ResultStore
+
+
+def test_small_results_are_returned_inline():
+    store = ResultStore(threshold_bytes=100)
+    assert json.loads(store.maybe_store(["short"])) == ["short"]
+    assert store.stored_count == 0
+
+
+def test_large_results_are_stored_and_previewed():
+    store = ResultStore(threshold_bytes=100, preview_chars=10)
+    text = "".join(str(i % 10) for i in range(500))
+    preview, note = json.loads(store.maybe_store([text]))
+
+    assert preview == text[:10]
+    assert "handle 'result-1'" in note
+    assert store.stored_count == 1
+    assert store.bytes_saved > 0
+
+
+def test_read_pages_through_a_result():
+    store = ResultStore(threshold_bytes=10, page_chars=40)
+    text = "abcdefghij" * 10
+    store.maybe_store([text])
+
+    (page,) = json.loads(store.read("result-1"))
+    assert page.startswith(text[:40])
+    assert "continue with offset=40" in page
+
+    pages, offset = [], 0
+    while offset < len(text):
+        (page,) = json.loads(store.read("result-1", offset, 30))
+        pages.append(page.split("\n[")[0])
+        offset += 30
+    assert "".join(pages) == text
+
+    (last,) = json.loads(store.read("result-1", 90))
+    assert last == text[90:]
+
+
+@pytest.mark.parametrize(
+    "offset, length", [(-1, None), (0, 0), (0, -5), (-10, 10)]
+)
+def test_read_rejects_invalid_ranges(offset, length):
+    store = ResultStore(threshold_bytes=10)
+    store.maybe_store(["x" * 100])
+    with pytest.raises(ValueError):
+        store.read("result-1", offset, length)
+
+
+def test_read_unknown_handle():
+    with pytest.raises(ValueError, match="No stored tool result"):
+        ResultStore().read("result-9")
+
+
+def test_oldest_results_are_evicted():
+    store = ResultStore(threshold_bytes=10, max_entries=2)
+    for _ in range(3):
+        store.maybe_store(["x" * 100])
+    with pytest.raises(ValueError):
+        store.read("result-1")
+    store.read("result-2")
+    store.read("result-3")
+    assert store.metrics()["retained_results"] == 2
@@ -0,0 +1,61 @@
+from search_index import InvertedIndex, SNIPPET_TOKENS, snippet, tokenize
+
+
+def test_tokenize():
+    assert tokenize("The Condenser-tower, 20m!") == [
+        "the",
+        "condenser",
+        "tower",
+        "20m",
+    ]
+
+
+def test_search_ranks_by_bm25():
+    index = InvertedIndex()
+    index.add("one", "tower tower tower pump")
+    index.add("two", "tower pump valve")
+    index.add("three", "valve valve")
+
+    results = index.search("tower")
+    assert [doc_id for doc_id, _ in results] == ["one", "two"]
+    assert results[0][1] > results[1][1] > 0
+
+    # A rare term weighs more than a common one
+    scores = dict(index.search("pump valve"))
+    assert scores["two"] > scores["one"]
+    assert index.search("missing") == []
+
+
+def test_search_limit():
+    index = InvertedIndex()
+    for i in range(20):
+        index.add(f"doc{i}", "word " * (i + 1))
+    assert len(index.search("word", limit=5)) == 5
+
+
+def test_add_replaces_and_remove_forgets():
+    index = InvertedIndex()
+    index.add("doc", "alpha beta")
+    index.add("doc", "gamma")
+    assert index.search("alpha") == []
+    assert [doc_id for doc_id, _ in index.search("gamma")] == ["doc"]
+
+    index.remove("doc")
+    assert index.search("gamma") == []
+    assert index._total_length == 0
+    # Removing an unknown document is a no-op
+    index.remove("doc")
+
+
+def test_snippet_window():
+    words = [f"w{i}" for i in range(100)]
+    words[50] = "needle"
+    text = " ".join(words)
+
+    excerpt = snippet(text, {"needle"})
+    assert excerpt.startswith("…") and excerpt.endswith("…")
+    assert "needle" in excerpt
+    assert len(tokenize(excerpt)) == SNIPPET_TOKENS
+
+    assert snippet("short text", {"short"}) == "short text"
+    assert snippet("", {"x"}) == ""
@@ -0,0 +1,240 @@
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+import pytest
+from mcp.types import (
+    CallToolResult,
+    TextContent,
+    Tool,
+    ToolListChangedNotification,
+)
+from core.tools import ToolManager
+
+
+class FakeClient:
+    """Serves tools that sleep for a given time and echo their input."""
+
+    def __init__(self, tools: list[str], delay: float = 0.0):
+        self.tools = tools
+        self.delay = delay
+        self.handlers = []
+        self.list_calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    def add_notification_handler(self, handler):
+        self.handlers.append(handler)
+
+    async def list_tools(self) -> list[Tool]:
+        self.list_calls += 1
+        return [
+            Tool(name=name, description=name, inputSchema={"type": "object"})
+            for name in self.tools
+        ]
+
+    async def call_tool(self, tool_name: str, tool_input) -> CallToolResult:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if tool_name == "fail":
+                raise RuntimeError("boom")
+            await asyncio.sleep(tool_input.get("delay", self.delay))
+            return CallToolResult(
+                content=[TextContent(type="text", text=json.dumps(tool_input))]
+            )
+        finally:
+            self.active -= 1
+
+
+def tool_use(name: str, tool_id: str, **tool_input):
+    return SimpleNamespace(
+        type="tool_use", id=tool_id, name=name, input=tool_input
+    )
+
+
+def message(*blocks):
+    return SimpleNamespace(content=list(blocks))
+
+
+def test_results_keep_request_order():
+    async def run():
+        client = FakeClient(["echo"])
+        manager = ToolManager({"a": client})
+        return await manager.execute_tool_requests(
+            message(
+                tool_use("echo", "1", delay=0.05),
+                SimpleNamespace(type="text", text="thinking"),
+                tool_use("echo", "2", delay=0.0),
+                tool_use("echo", "3", delay=0.02),
+            )
+        )
+
+    results = asyncio.run(run())
+    assert [result["tool_use_id"] for result in results] == ["1", "2", "3"]
+    assert not any(result["is_error"] for result in results)
+
+
+def test_requests_run_concurrently():
+    async def run():
+        client = FakeClient(["echo"], delay=0.1)
+        manager = ToolManager({"a": client})
+        start = time.perf_counter()
+        await manager.execute_tool_requests(
+            message(*(tool_use("echo", str(i)) for i in range(5)))
+        )
+        return time.perf_counter() - start, client.max_active
+
+    elapsed, max_active = asyncio.run(run())
+    assert max_active == 5
+    assert elapsed < 0.3
+
+
+def test_concurrency_limits():
+    async def run():
+        a, b = FakeClient(["a_tool"], 0.05), FakeClient(["b_tool"], 0.05)
+        manager = ToolManager(
+            {"a": a, "b": b},
+            max_concurrency=3,
+            max_concurrency_per_server=2,
+        )
+        await manager.execute_tool_requests(
+            message(
+                *(tool_use("a_tool", f"a{i}") for i in range(6)),
+                *(tool_use("b_tool", f"b{i}") for i in range(6)),
+            )
+        )
+        return a.max_active, b.max_active
+
+    a_max, b_max = asyncio.run(run())
+    assert a_max <= 2 and b_max <= 2
+    assert a_max + b_max >= 3
+
+
+def test_busy_server_does_not_hold_global_slots():
+    async def run():
+        a, b = FakeClient(["slow"], 0.5), FakeClient(["fast"], 0.0)
+        manager = ToolManager(
+            {"a": a, "b": b},
+            max_concurrency=2,
+            max_concurrency_per_server=1,
+        )
+        await manager.refresh()
+        finished = {}
+
+        async def call(request):
+            await manager.execute_tool_request(request)
+            finished[request.id] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(call(tool_use("slow", f"slow{i}")) for i in range(3)),
+            call(tool_use("fast", "fast")),
+        )
+        return finished
+
+    finished = asyncio.run(run())
+    assert finished["fast"] < 0.25
+    assert finished["slow2"] >= 1.4
+
+
+def test_timeout_and_errors_are_isolated():
+    async def run():
+        client = FakeClient(["echo", "fail"])
+        manager = ToolManager({"a": client}, tool_timeout=0.1)
+        return await manager.execute_tool_requests(
+            message(
+                tool_use("echo", "slow", delay=1.0),
+                tool_use("fail", "fail"),
+                tool_use("missing", "missing"),
+                tool_use("echo", "ok", value=1),
+            )
+        )
+
+    slow, fail, missing, ok = asyncio.run(run())
+    assert slow["is_error"] and "timed out" in slow["content"]
+    assert fail["is_error"] and "boom" in fail["content"]
+    assert missing["is_error"]
+    assert not ok["is_error"]
+    assert json.loads(json.loads(ok["content"])[0]) == {"value": 1}
+
+
+def list_changed():
+    return ToolListChangedNotification(
+        method="notifications/tools/list_changed"
+    )
+
+
+def test_tools_are_indexed_by_name_and_listed_once():
+    async def run():
+        a, b = FakeClient(["a1", "a2"]), FakeClient(["b1"])
+        manager = ToolManager({"a": a, "b": b})
+        names = [tool["name"] for tool in await manager.get_all_tools()]
+        await manager.get_all_tools()
+        found = [
+            await manager._find_client_with_tool(name)
+            for name in ["a2", "b1", "missing"]
+        ]
+        return names, found, a.list_calls, b.list_calls
+
+    names, found, a_calls, b_calls = asyncio.run(run())
+    assert names == ["a1", "a2", "b1"]
+    assert found == ["a", "b", None]
+    assert (a_calls, b_calls) == (1, 1)
+
+
+def test_duplicate_tool_names_are_rejected():
+    async def run():
+        manager = ToolManager(
+            {"a": FakeClient(["same"]), "b": FakeClient(["same"])}
+        )
+        await manager.get_all_tools()
+
+    with pytest.raises(ValueError, match="exported by both 'a' and 'b'"):
+        asyncio.run(run())
+
+
+def test_tools_are_listed_again_after_a_notification():
+    async def run():
+        a, b = FakeClient(["old"]), FakeClient(["other"])
+        manager = ToolManager({"a": a, "b": b})
+        await manager.get_all_tools()
+
+        a.tools = ["new"]
+        await a.handlers[0](list_changed())
+        names = [tool["name"] for tool in await manager.get_all_tools()]
+        return names, a.list_calls, b.list_calls
+
+    names, a_calls, b_calls = asyncio.run(run())
+    assert names == ["new", "other"]
+    # Only the client that changed is listed again
+    assert (a_calls, b_calls) == (2, 1)
+
+
+def test_notification_during_listing_is_not_lost():
+    class SlowListing(FakeClient):
+        async def list_tools(self):
+            tools = await super().list_tools()
+            if self.list_calls == 1:
+                # The server changes its tools while the list is in flight
+                self.tools = ["new"]
+                await self.handlers[0](list_changed())
+            return tools
+
+    async def run():
+        manager = ToolManager({"a": SlowListing(["old"])})
+        first = [tool["name"] for tool in await manager.get_all_tools()]
+        second = [tool["name"] for tool in await manager.get_all_tools()]
+        return first, second
+
+    assert asyncio.run(run()) == (["old"], ["new"])
+
+
+def test_concurrent_refreshes_list_once():
+    async def run():
+        client = FakeClient(["echo"])
+        manager = ToolManager({"a": client})
+        await asyncio.gather(*(manager.refresh() for _ in range(5)))
+        return client.list_calls
+
+    assert asyncio.run(run()) == 1
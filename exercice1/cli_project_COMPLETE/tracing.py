@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import secrets
+import threading
+from pathlib import Path
+from typing import Any, Optional
+from contextvars import ContextVar
+from contextlib import contextmanager, nullcontext
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        kind: int,
+        attributes: dict,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header pointing at this span."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+                if value is not None
+            ],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error is not None:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _parse_traceparent(header: str) -> Optional[tuple[str, str]]:
+    parts = header.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar(
+    "current_span", default=None
+)
+
+
+class Tracer:
+    """Appends finished spans to a file in the OTLP JSON format, one
+    ExportTraceServiceRequest per line, as the OpenTelemetry Collector's
+    file exporter writes them.
+
+    Several processes may append to the same file; the client and the
+    servers it spawns share one trace through the traceparent they pass
+    in MCP request metadata."""
+
+    def __init__(self, path: Path, service_name: str):
+        self.path = Path(path)
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        kind: int = INTERNAL,
+        traceparent: Optional[str] = None,
+        **attributes,
+    ):
+        """Runs the block in a span, the child of traceparent when given
+        and otherwise of the current span."""
+        remote = _parse_traceparent(traceparent) if traceparent else None
+        parent = _current_span.get()
+        if remote:
+            trace_id, parent_id = remote
+        elif parent:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+
+        span = Span(name, trace_id, parent_id, kind, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._export(span)
+
+    def _export(self, span: Span):
+        line = json.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                {
+                                    "key": "service.name",
+                                    "value": _otlp_value(self.service_name),
+                                }
+                            ]
+                        },
+                        "scopeSpans": [
+                            {
+                                "scope": {"name": "cli_project"},
+                                "spans": [span.to_otlp()],
+                            }
+                        ],
+                    }
+                ]
+            },
+            separators=(",", ":"),
+        )
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a") as f:
+                f.write(line + "\n")
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure(path: str, service_name: str):
+    global _tracer
+    _tracer = Tracer(Path(path), service_name) if path else None
+
+
+def configure_from_env(service_name: str):
+    """Enables tracing when MCP_TRACE_PATH is set, as it is for servers
+    started by a traced client."""
+    configure(os.getenv("MCP_TRACE_PATH", ""), service_name)
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, **kwargs):
+    """A span of the configured tracer, or a no-op when tracing is off."""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.span(name, **kwargs)
+
+
+def annotate(**attributes):
+    """Sets attributes on the current span, if any."""
+    current = _current_span.get()
+    if current:
+        current.attributes.update(attributes)
+
+
+def current_traceparent() -> Optional[str]:
+    current = _current_span.get()
+    return current.traceparent if current else None